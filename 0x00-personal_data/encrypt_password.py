@@ -4,27 +4,231 @@ function that expects one string argument
 name password and returns a salted,
 hashed password, which is a byte string
 """
+import argparse
 import bcrypt
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
 
 
-def hash_password(password: str) -> bytes:
+# bcrypt cost factor used when none is given nor calibrated
+DEFAULT_ROUNDS = 12
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+
+# File holding the calibrated cost factor, next to this module unless
+# BCRYPT_ROUNDS_FILE says otherwise, so the cost does not depend on the
+# directory the process starts from
+ROUNDS_FILE = os.getenv("BCRYPT_ROUNDS_FILE", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".bcrypt_rounds.json"))
+
+# Executors usable by the batch functions
+POOL_MODES = {
+    "process": ProcessPoolExecutor,
+    "thread": ThreadPoolExecutor,
+}
+
+# Cost factor read from each rounds file, by absolute path
+_rounds = {}
+
+
+def calibrate(target_ms: float = 250, samples: int = 3) -> int:
+    """
+    Find the highest bcrypt cost factor hashing within a latency budget
+    on the current host.
+
+    :param target_ms: The latency budget of one hash, in milliseconds.
+    :param samples: Number of hashes timed per cost factor.
+    :return: The chosen cost factor, at least MIN_ROUNDS.
+    """
+    password = b"calibration-password"
+    best = MIN_ROUNDS
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        salt = bcrypt.gensalt(rounds)
+        start = time.perf_counter()
+        for _ in range(samples):
+            bcrypt.hashpw(password, salt)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / samples
+        if elapsed_ms > target_ms:
+            break
+        best = rounds
+        # Each extra round doubles the cost: stop before overshooting
+        if elapsed_ms * 2 > target_ms:
+            break
+    return best
+
+
+def save_rounds(rounds: int, path: str = ROUNDS_FILE):
+    """
+    Persist a cost factor for hash_password to use.
+
+    :param rounds: The bcrypt cost factor.
+    :param path: The file to write.
+    """
+    with open(path, 'w') as f:
+        json.dump({"rounds": rounds}, f)
+    _rounds[os.path.abspath(path)] = rounds
+
+
+def get_rounds(path: str = ROUNDS_FILE) -> int:
+    """
+    Get the calibrated cost factor, or DEFAULT_ROUNDS when the host
+    has not been calibrated.
+
+    :param path: The file written by save_rounds.
+    :return: The bcrypt cost factor.
+    """
+    key = os.path.abspath(path)
+    if key not in _rounds:
+        try:
+            with open(path, 'r') as f:
+                _rounds[key] = int(json.load(f)["rounds"])
+        except (OSError, ValueError, KeyError, TypeError):
+            _rounds[key] = DEFAULT_ROUNDS
+    return _rounds[key]
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """
+    Read the cost factor a bcrypt hash was made with.
+
+    :param hashed_password: The hashed password.
+    :return: The cost factor.
+    """
+    return int(hashed_password.split(b"$")[2])
+
+
+def needs_rehash(hashed_password: bytes,
+                 rounds: Optional[int] = None
+                 ) -> bool:
+    """
+    Tell whether a hash uses a lower cost factor than the current one.
+
+    :param hashed_password: The hashed password.
+    :param rounds: The current cost factor, calibrated one by default.
+    :return: True if the password should be hashed again.
+    """
+    if rounds is None:
+        rounds = get_rounds()
+    return hash_rounds(hashed_password) < rounds
+
+
+def hash_password(password: str, rounds: Optional[int] = None) -> bytes:
     """
     Hash a password using bcrypt.
 
     :param password: The password to hash.
+    :param rounds: The bcrypt cost factor, calibrated one by default.
     :return: The salted, hashed password as a byte string.
     """
-    salt = bcrypt.gensalt()
+    if rounds is None:
+        rounds = get_rounds()
+    salt = bcrypt.gensalt(rounds)
     hashed = bcrypt.hashpw(password.encode(), salt)
     return hashed
 
 
-def is_valid(hashed_password: bytes, password: str) -> bool:
+def is_valid(hashed_password: bytes,
+             password: str,
+             on_outdated: Optional[Callable[[bytes], None]] = None
+             ) -> bool:
     """
     Validate a password against a hashed password using bcrypt.
 
     :param hashed_password: The hashed password.
     :param password: The password to validate.
+    :param on_outdated: Called with the hash when the password is valid
+        but the hash uses an outdated cost factor, so the caller can
+        store a new hash of the password.
     :return: True if the password matches the hashed password, False otherwise.
     """
-    return bcrypt.checkpw(password.encode(), hashed_password)
+    valid = bcrypt.checkpw(password.encode(), hashed_password)
+    if valid and on_outdated is not None and needs_rehash(hashed_password):
+        on_outdated(hashed_password)
+    return valid
+
+
+def _hash_job(job: Tuple[str, int]) -> bytes:
+    """
+    Hash one (password, rounds) job in a pool worker.
+    """
+    return hash_password(*job)
+
+
+def _verify_job(job: Tuple[bytes, str]) -> bool:
+    """
+    Check one (hashed_password, password) job in a pool worker.
+    """
+    return is_valid(*job)
+
+
+def _run_jobs(func: Callable,
+              jobs: Iterable,
+              workers: Optional[int],
+              mode: str
+              ) -> List:
+    """
+    Run jobs on a pool and return their results in input order.
+
+    :param func: Top-level function applied to every job.
+    :param jobs: The jobs to run.
+    :param workers: Size of the pool, None for the number of CPUs,
+        1 to run on the calling thread.
+    :param mode: "process" or "thread"; bcrypt releases the GIL,
+        so threads also run in parallel.
+    :return: The list of results.
+    """
+    if mode not in POOL_MODES:
+        raise ValueError(f"Unknown pool mode: {mode}")
+    if workers == 1:
+        return [func(job) for job in jobs]
+    with POOL_MODES[mode](max_workers=workers) as executor:
+        return list(executor.map(func, jobs, chunksize=32))
+
+
+def hash_passwords(passwords: Iterable[str],
+                   workers: Optional[int] = None,
+                   rounds: Optional[int] = None,
+                   mode: str = "process"
+                   ) -> List[bytes]:
+    """
+    Hash many passwords in parallel.
+
+    :param passwords: The passwords to hash.
+    :param workers: Number of workers, None for the number of CPUs.
+    :param rounds: The bcrypt cost factor, calibrated one by default.
+    :param mode: "process" or "thread" pool.
+    :return: The hashed passwords, in input order.
+    """
+    if rounds is None:
+        rounds = get_rounds()
+    jobs = ((password, rounds) for password in passwords)
+    return _run_jobs(_hash_job, jobs, workers, mode)
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]],
+                workers: Optional[int] = None,
+                mode: str = "process"
+                ) -> List[bool]:
+    """
+    Validate many passwords against their hashes in parallel.
+
+    :param pairs: (hashed_password, password) tuples.
+    :param workers: Number of workers, None for the number of CPUs.
+    :param mode: "process" or "thread" pool.
+    :return: The validation results, in input order.
+    """
+    return _run_jobs(_verify_job, pairs, workers, mode)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Calibrate the bcrypt cost factor for this host")
+    parser.add_argument("--target-ms", type=float, default=250,
+                        help="latency budget of one hash in milliseconds")
+    args = parser.parse_args()
+    rounds = calibrate(args.target_ms)
+    save_rounds(rounds)
+    print(f"bcrypt rounds: {rounds} (saved to {ROUNDS_FILE})")
@@ -3,11 +3,168 @@
 function called filter_datum that
 returns the log message obfuscated
 """
+import argparse
+import atexit
+import collections
+import json
 import logging
+import logging.handlers
+import queue
 import re
 import os
+import sys
+import threading
+import time
 import mysql.connector
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
+from typing import (Any, Dict, Iterable, Iterator, List, Mapping, Optional,
+                    Pattern, Tuple)
+
+
+# Maximum number of (fields, separator) patterns kept compiled
+PATTERN_CACHE_SIZE = 128
+
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def _compile_pattern(fields: Tuple[str, ...],
+                     separator: str
+                     ) -> Optional[Pattern]:
+    """
+    Compile the alternation pattern matching every `field=value`
+    pair of a log message. Results are kept in a bounded LRU cache.
+
+    :param fields: Tuple of the field names to match.
+    :param separator: Character separating the fields.
+    :return: The compiled pattern, or None if there is no field.
+    """
+    if not fields:
+        return None
+    names = '|'.join(re.escape(field) for field in fields)
+    return re.compile(f'(?P<field>{names})=[^{re.escape(separator)}]*')
+
+
+class Redactor:
+    """
+    Reusable redaction engine for a fixed set of fields.
+
+    The pattern is compiled once per (fields, separator) pair and the
+    matches are replaced through a backreference template, so no
+    Python callback runs per match.
+    """
+
+    def __init__(self, fields: List[str], redaction: str, separator: str):
+        """
+        Initialize the redactor.
+
+        :param fields: List of strings representing the fields to obfuscate.
+        :param redaction: String to replace the field values with.
+        :param separator: Character separating the fields.
+        """
+        self.fields = tuple(fields)
+        self.redaction = redaction
+        self.separator = separator
+        self.pattern = _compile_pattern(self.fields, separator)
+        self.template = '\\g<field>=' + redaction.replace('\\', '\\\\')
+
+    def redact(self, message: str) -> str:
+        """
+        Obfuscate the values of the configured fields in a message.
+
+        :param message: String representing the log message.
+        :return: The obfuscated log message.
+        """
+        if self.pattern is None:
+            return message
+        return self.pattern.sub(self.template, message)
+
+
+class FieldScanner:
+    """
+    Non-regex redaction engine producing the same output as Redactor.
+
+    The message is split on the separator once and each `key=` prefix
+    is looked up in a frozenset of field names, then the line is
+    rebuilt with a single join. The separator must be one character,
+    like the character class used by the regex engine.
+    """
+
+    def __init__(self, fields: List[str], redaction: str, separator: str):
+        """
+        Initialize the scanner.
+
+        :param fields: List of strings representing the fields to obfuscate.
+        :param redaction: String to replace the field values with.
+        :param separator: Character separating the fields.
+        """
+        self.fields = tuple(fields)
+        self.redaction = redaction
+        self.separator = separator
+        self.names = frozenset(self.fields)
+        self.lengths = sorted({len(field) for field in self.names},
+                              reverse=True)
+        self.endings = frozenset(field[-1:] for field in self.names
+                                 if field)
+
+    def _match(self, segment: str) -> int:
+        """
+        Find where the longest field name ending `segment` starts.
+
+        :param segment: Text preceding an `=` sign.
+        :return: The start index of the field name, or -1.
+        """
+        if segment in self.names:
+            return 0
+        if segment[-1:] not in self.endings and '' not in self.names:
+            return -1
+        size = len(segment)
+        for length in self.lengths:
+            if length < size and segment[size - length:] in self.names:
+                return size - length
+        return -1
+
+    def _redact_token(self, token: str) -> str:
+        """
+        Redact the first `field=value` pair found in one token.
+
+        :param token: Text between two separators.
+        :return: The redacted token.
+        """
+        equal = token.find('=')
+        if equal == -1:
+            return token
+        if token[:equal] in self.names:
+            return token[:equal + 1] + self.redaction
+        start = 0
+        while equal != -1:
+            index = self._match(token[start:equal])
+            if index != -1:
+                return token[:equal + 1] + self.redaction
+            start = equal + 1
+            equal = token.find('=', start)
+        return token
+
+    def redact(self, message: str) -> str:
+        """
+        Obfuscate the values of the configured fields in a message.
+
+        :param message: String representing the log message.
+        :return: The obfuscated log message.
+        """
+        if not self.names:
+            return message
+        tokens = message.split(self.separator)
+        return self.separator.join([self._redact_token(token)
+                                    for token in tokens])
+
+
+# Redaction engines selectable by RedactingFormatter
+REDACTION_BACKENDS = {
+    "regex": Redactor,
+    "scan": FieldScanner,
+}
 
 
 def filter_datum(fields: List[str],
@@ -28,11 +185,7 @@ def filter_datum(fields: List[str],
         separating all fields in the log message.
     :return: The obfuscated log message.
     """
-    pattern = '|'.join([f'{field}=[^{separator}]*' for field in fields])
-    return re.sub(pattern,
-                  lambda m: f"{m.group().split('=')[0]}={redaction}",
-                  message
-                  )
+    return Redactor(fields, redaction, separator).redact(message)
 
 
 class RedactingFormatter(logging.Formatter):
@@ -44,14 +197,21 @@ class RedactingFormatter(logging.Formatter):
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
 
-    def __init__(self, fields: List[str]):
+    def __init__(self, fields: List[str], backend: str = "regex"):
         """
         Initialize the formatter with the fields to be redacted.
 
         :param fields: List of strings representing the fields to obfuscate.
+        :param backend: Name of the redaction engine, "regex" or "scan".
         """
         super(RedactingFormatter, self).__init__(self.FORMAT)
+        if backend not in REDACTION_BACKENDS:
+            raise ValueError(f"Unknown redaction backend: {backend}")
         self.fields = fields
+        self.backend = backend
+        self.redactor = REDACTION_BACKENDS[backend](fields,
+                                                    self.REDACTION,
+                                                    self.SEPARATOR)
 
     def format(self, record: logging.LogRecord) -> str:
         """
@@ -61,40 +221,265 @@ class RedactingFormatter(logging.Formatter):
         :return: The formatted string with sensitive information redacted.
         """
         original_message = super(RedactingFormatter, self).format(record)
-        return filter_datum(self.fields,
-                            self.REDACTION,
-                            original_message,
-                            self.SEPARATOR
-                            )
+        return self.redactor.redact(original_message)
+
+
+# Attributes every LogRecord has, anything else was passed as `extra`
+_RECORD_ATTRIBUTES = frozenset(
+    logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+# Compact encoder built once instead of on every json.dumps call
+_json_encoder = json.JSONEncoder(ensure_ascii=False,
+                                 separators=(",", ":"),
+                                 default=str)
+
+
+class JSONRedactingFormatter(logging.Formatter):
+    """
+    Formatter emitting one JSON object per record, masking sensitive
+    keys of structured data by lookup instead of scanning text.
+    """
+    REDACTION = RedactingFormatter.REDACTION
+
+    def __init__(self, fields: List[str]):
+        """
+        Initialize the formatter with the fields to be redacted.
+
+        :param fields: List of strings representing the fields to obfuscate.
+        """
+        super(JSONRedactingFormatter, self).__init__()
+        self.fields = fields
+        self.names = frozenset(fields)
+        self.redactor = Redactor(fields, self.REDACTION,
+                                 RedactingFormatter.SEPARATOR)
+
+    def mask(self, data: Mapping) -> Dict[str, Any]:
+        """
+        Copy a mapping, replacing the values of sensitive keys.
+
+        :param data: Structured log data, nested mappings and lists
+            included.
+        :return: The masked copy.
+        """
+        masked = {}
+        for key, value in data.items():
+            if key in self.names:
+                masked[key] = self.REDACTION
+            else:
+                masked[key] = self.mask_value(value)
+        return masked
+
+    def mask_value(self, value: Any) -> Any:
+        """
+        Mask the mappings a value holds, in lists and tuples too.
+
+        :param value: A value of structured log data.
+        :return: The masked copy, or the value itself if it holds no
+            mapping.
+        """
+        if isinstance(value, Mapping):
+            return self.mask(value)
+        if isinstance(value, (list, tuple)):
+            return [self.mask_value(item) for item in value]
+        return value
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Format the log record as a JSON line, redacting sensitive
+        information.
+
+        A mapping message and the `extra` attributes are masked by key;
+        a plain text message still goes through the text redactor.
+
+        :param record: The log record to be formatted.
+        :return: The JSON object, without trailing newline.
+        """
+        payload = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+        }
+        if isinstance(record.msg, Mapping):
+            payload.update(self.mask(record.msg))
+        else:
+            payload["message"] = self.redactor.redact(record.getMessage())
+        extra = {key: value for key, value in record.__dict__.items()
+                 if key not in _RECORD_ATTRIBUTES}
+        if extra:
+            payload.update(self.mask(extra))
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return _json_encoder.encode(payload)
 
 
 # Define the PII_FIELDS constant
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
 
 
-def get_logger() -> logging.Logger:
+# Behaviours of the asynchronous logger when its queue is full
+OVERFLOW_POLICIES = ("block", "drop-oldest", "drop-newest")
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler applying a backpressure policy on a bounded queue
+    and counting the records it had to drop.
+    """
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = "block"):
+        """
+        Initialize the handler.
+
+        :param log_queue: Bounded queue shared with the listener.
+        :param overflow: One of OVERFLOW_POLICIES.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        super(BoundedQueueHandler, self).__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+        self.closed = False
+
+    def close(self):
+        """
+        Refuse every record from now on, once the one being queued, if
+        any, is on the queue.
+        """
+        self.acquire()
+        try:
+            self.closed = True
+        finally:
+            self.release()
+        super(BoundedQueueHandler, self).close()
+
+    def enqueue(self, record: logging.LogRecord):
+        """
+        Put a record on the queue according to the overflow policy,
+        unless the handler is closed.
+
+        :param record: The prepared log record.
+        """
+        if self.closed:
+            return
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                self.dropped += 1
+                if self.overflow == "drop-newest":
+                    return
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                self.dropped -= 1
+
+
+class FlushingQueueListener(logging.handlers.QueueListener):
+    """
+    Queue listener whose stop sentinel waits for room in a full queue,
+    so every record queued before stop() is still written.
+    """
+
+    def enqueue_sentinel(self):
+        """
+        Block until the stop sentinel fits in the queue.
+        """
+        self.queue.put(self._sentinel)
+
+
+_queue_handler = None
+_listener = None
+
+
+def shutdown():
+    """
+    Stop the asynchronous logging pipeline, writing every queued record.
+    """
+    global _queue_handler, _listener
+    if _listener is not None:
+        # Detach and close the handler first: a record queued after the
+        # listener stopped would never be written, or block on a full
+        # queue. Closing waits for a record being queued by a thread
+        # that found the handler before it was detached
+        logging.getLogger("user_data").removeHandler(_queue_handler)
+        _queue_handler.close()
+        _listener.stop()
+    _queue_handler = None
+    _listener = None
+
+
+def dropped_records() -> int:
+    """
+    Number of records dropped by the asynchronous logger.
+
+    :return: The counter of the running pipeline, 0 if there is none.
+    """
+    if _queue_handler is None:
+        return 0
+    return _queue_handler.dropped
+
+
+# Name of the handlers attached by get_logger, replaced on each call
+HANDLER_NAME = "filtered_logger"
+
+
+def get_logger(asynchronous: bool = False,
+               max_queue_size: int = 10000,
+               overflow: str = "block"
+               ) -> logging.Logger:
     """
     Create and configure a logger with a stream handler
-    and a redacting formatter.
+    and a redacting formatter, replacing the handlers of earlier calls.
 
+    :param asynchronous: Redact and write records on a background
+        thread fed through a queue.
+    :param max_queue_size: Capacity of the queue, 0 for unbounded.
+    :param overflow: What to do when the queue is full, one of
+        OVERFLOW_POLICIES.
     :return: Configured logger object.
     """
+    global _queue_handler, _listener
     logger = logging.getLogger("user_data")
     logger.setLevel(logging.INFO)
     logger.propagate = False
 
+    # Records would otherwise be written once per call, and also on the
+    # caller's thread in asynchronous mode
+    shutdown()
+    for handler in list(logger.handlers):
+        if handler.name == HANDLER_NAME:
+            logger.removeHandler(handler)
+
     stream_handler = logging.StreamHandler()
+    stream_handler.set_name(HANDLER_NAME)
     formatter = RedactingFormatter(fields=PII_FIELDS)
     stream_handler.setFormatter(formatter)
 
-    logger.addHandler(stream_handler)
+    if not asynchronous:
+        logger.addHandler(stream_handler)
+        return logger
+
+    log_queue = queue.Queue(max_queue_size)
+    _queue_handler = BoundedQueueHandler(log_queue, overflow)
+    _queue_handler.set_name(HANDLER_NAME)
+    _listener = FlushingQueueListener(log_queue, stream_handler)
+    _listener.start()
+    logger.addHandler(_queue_handler)
 
     return logger
 
 
-def get_db():
+atexit.register(shutdown)
+
+
+def connect_db():
     """
-    Obtain a database connection using credentials from environment variables.
+    Open a new database connection using credentials from environment
+    variables.
 
     :return: A MySQL database connection object.
     """
@@ -113,25 +498,349 @@ def get_db():
     return connection
 
 
-def main():
+class PooledConnection:
+    """
+    Proxy to a pooled connection: closing it gives the connection
+    back to its pool instead of closing the socket. A proxy collected
+    without being closed closes the connection and frees its slot.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', connection):
+        """
+        Wrap a connection checked out from a pool.
+
+        :param pool: The pool owning the connection.
+        :param connection: The underlying database connection.
+        """
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name: str):
+        """
+        Delegate every other attribute to the underlying connection.
+        """
+        if self._connection is None:
+            raise AttributeError(f"Connection already closed: {name}")
+        return getattr(self._connection, name)
+
+    def close(self):
+        """
+        Return the connection to the pool.
+        """
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection)
+
+    def __del__(self):
+        """
+        Free the slot of a connection that was never closed; its state
+        is unknown, so it is closed rather than reused.
+        """
+        connection = self.__dict__.get("_connection")
+        if connection is not None:
+            self._connection = None
+            self._pool.discard(connection)
+
+
+class ConnectionPool:
+    """
+    Bounded pool of database connections, health checked on checkout
+    and recycled after staying idle too long.
+    """
+
+    def __init__(self, connect, size: int = 5, max_idle: float = 300):
+        """
+        Initialize an empty pool.
+
+        :param connect: Callable opening a new connection.
+        :param size: Maximum number of connections checked out at once.
+        :param max_idle: Seconds after which an idle connection is
+            closed instead of reused.
+        """
+        if size < 1:
+            raise ValueError("Pool size must be positive")
+        self._connect = connect
+        self.size = size
+        self.max_idle = max_idle
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @staticmethod
+    def _is_healthy(connection) -> bool:
+        """
+        Check that a connection still talks to the server.
+
+        :param connection: The connection to check.
+        :return: True if the connection is usable.
+        """
+        try:
+            return bool(connection.is_connected())
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(connection):
+        """
+        Close a connection leaving the pool, ignoring errors.
+
+        :param connection: The connection to close.
+        """
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _checkout(self):
+        """
+        Take the most recently used healthy connection or open one.
+
+        :return: A database connection.
+        """
+        while True:
+            deadline = time.monotonic() - self.max_idle
+            with self._lock:
+                stale = []
+                while self._idle and self._idle[0][1] < deadline:
+                    stale.append(self._idle.popleft()[0])
+                connection = self._idle.pop()[0] if self._idle else None
+            for old in stale:
+                self._discard(old)
+            if connection is None:
+                return self._connect()
+            if self._is_healthy(connection):
+                return connection
+            self._discard(connection)
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        """
+        Check a connection out of the pool.
+
+        :param timeout: Seconds to wait for a free slot, None to wait
+            forever.
+        :return: A connection whose close() releases it.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No database connection available")
+        try:
+            connection = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+        return PooledConnection(self, connection)
+
+    def discard(self, connection):
+        """
+        Close a checked out connection instead of giving it back, and
+        free its slot.
+
+        :param connection: The underlying database connection.
+        """
+        self._discard(connection)
+        self._slots.release()
+
+    def release(self, connection):
+        """
+        Give a connection back to the pool.
+
+        :param connection: The underlying database connection.
+        """
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+        self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """
+        Context manager checking a connection out and back in.
+
+        :param timeout: Seconds to wait for a free slot.
+        """
+        pooled = self.acquire(timeout)
+        try:
+            yield pooled
+        finally:
+            pooled.close()
+
+    def close_all(self):
+        """
+        Close every idle connection.
+        """
+        with self._lock:
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+        for connection in idle:
+            self._discard(connection)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Get the process-wide connection pool, sized by
+    PERSONAL_DATA_DB_POOL_SIZE and recycling connections idle for more
+    than PERSONAL_DATA_DB_POOL_MAX_IDLE seconds.
+
+    :return: The shared ConnectionPool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            size = int(os.getenv("PERSONAL_DATA_DB_POOL_SIZE", 5))
+            max_idle = float(os.getenv("PERSONAL_DATA_DB_POOL_MAX_IDLE", 300))
+            _pool = ConnectionPool(connect_db, size, max_idle)
+        return _pool
+
+
+def get_db():
+    """
+    Obtain a database connection using credentials from environment variables.
+
+    The connection comes from the shared pool and goes back to it when
+    closed. When every pooled connection is checked out, a new
+    connection outside the pool is returned instead of waiting.
+
+    :return: A MySQL database connection object.
+    """
+    try:
+        return get_pool().acquire(timeout=0)
+    except TimeoutError:
+        return connect_db()
+
+
+# Rows fetched per round trip when PERSONAL_DATA_BATCH_SIZE is not set
+DEFAULT_BATCH_SIZE = 1000
+
+
+def get_batch_size() -> int:
+    """
+    Read the number of rows to fetch at once from the environment.
+
+    :return: The positive batch size.
+    """
+    batch_size = int(os.getenv("PERSONAL_DATA_BATCH_SIZE",
+                               DEFAULT_BATCH_SIZE))
+    if batch_size < 1:
+        raise ValueError("PERSONAL_DATA_BATCH_SIZE must be positive")
+    return batch_size
+
+
+def iter_rows(cursor, batch_size: int) -> Iterator[Dict]:
+    """
+    Stream the result set of an executed cursor with fetchmany,
+    so only one batch of rows is held in memory at a time.
+
+    :param cursor: Cursor on which a query has been executed.
+    :param batch_size: Number of rows fetched per call.
+    :return: Iterator over the rows.
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def format_row(row: Dict) -> str:
+    """
+    Build the log message of a row of the 'users' table.
+
+    :param row: Mapping of column names to values.
+    :return: The `key=value` message.
+    """
+    return "; ".join([f"{key}={value}" for key, value in row.items()])
+
+
+_worker_formatter = None
+
+
+def redact_chunk(rows: List[Dict]) -> List[str]:
+    """
+    Format and redact a chunk of rows in a worker process.
+
+    :param rows: Rows of the 'users' table.
+    :return: The redacted log lines, in the same order.
+    """
+    global _worker_formatter
+    if _worker_formatter is None:
+        _worker_formatter = RedactingFormatter(fields=PII_FIELDS)
+    lines = []
+    for row in rows:
+        record = logging.makeLogRecord({"name": "user_data",
+                                        "levelno": logging.INFO,
+                                        "levelname": "INFO",
+                                        "msg": format_row(row)})
+        lines.append(_worker_formatter.format(record))
+    return lines
+
+
+def redact_parallel(rows: Iterable[Dict],
+                    workers: int,
+                    chunk_size: int
+                    ) -> Iterator[str]:
+    """
+    Redact a stream of rows with a pool of worker processes.
+
+    Chunks are submitted in source order and at most two chunks per
+    worker are in flight, so lines come out in the order of the rows
+    and memory stays bounded.
+
+    :param rows: Rows of the 'users' table.
+    :param workers: Number of worker processes.
+    :param chunk_size: Number of rows sent to a worker at once.
+    :return: Iterator over the redacted log lines.
+    """
+    rows = iter(rows)
+    pending = collections.deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                pending.append(executor.submit(redact_chunk, chunk))
+            if not pending:
+                return
+            yield from pending.popleft().result()
+
+
+def main(workers: int = 1):
     """
     Retrieve all rows from the 'users' table in the database and log each row
     with sensitive information redacted.
+
+    :param workers: Number of processes redacting the rows; with more
+        than one, the throughput is reported at the end of the run.
     """
     db = get_db()
-    cursor = db.cursor(dictionary=True)
+    cursor = db.cursor(dictionary=True, buffered=False)
     cursor.execute("SELECT * FROM users;")
-    rows = cursor.fetchall()
-
-    logger = get_logger()
+    batch_size = get_batch_size()
+    rows = iter_rows(cursor, batch_size)
 
-    for row in rows:
-        message = "; ".join([f"{key}={value}" for key, value in row.items()])
-        logger.info(message)
+    if workers > 1:
+        start = time.perf_counter()
+        count = 0
+        for line in redact_parallel(rows, workers, batch_size):
+            sys.stderr.write(line + "\n")
+            count += 1
+        elapsed = time.perf_counter() - start
+        rate = count / elapsed if elapsed else 0.0
+        print(f"{count} rows in {elapsed:.2f}s ({rate:.0f} rows/sec)")
+    else:
+        logger = get_logger()
+        for row in rows:
+            logger.info(format_row(row))
 
     cursor.close()
     db.close()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(
+        description="Log the users table with PII redacted")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of redaction processes")
+    main(parser.parse_args().workers)
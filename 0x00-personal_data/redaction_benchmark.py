@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite measuring the cost per record of the redaction paths
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+from filtered_logger import (PII_FIELDS, REDACTION_BACKENDS,
+                             JSONRedactingFormatter, RedactingFormatter,
+                             filter_datum, format_row, get_logger)
+
+
+def pii_column_count(field_count: int, pii_density: float) -> int:
+    """
+    Number of PII columns of a row: PII_FIELDS only has a few names, so
+    high densities on wide rows are capped.
+
+    :param field_count: Number of columns in the row.
+    :param pii_density: Requested share of PII columns.
+    :return: The number of PII columns.
+    """
+    return min(len(PII_FIELDS), round(field_count * pii_density))
+
+
+def build_row(field_count: int,
+              value_length: int,
+              pii_density: float,
+              rng: random.Random
+              ) -> Dict[str, str]:
+    """
+    Build a synthetic row of the 'users' table.
+
+    :param field_count: Number of columns in the row.
+    :param value_length: Length of every value.
+    :param pii_density: Share of the columns that are PII fields,
+        capped by pii_column_count.
+    :param rng: Random generator, seeded for reproducible runs.
+    :return: Mapping of column names to values.
+    """
+    pii_count = pii_column_count(field_count, pii_density)
+    keys = list(PII_FIELDS[:pii_count])
+    keys += [f"column_{i}" for i in range(field_count - pii_count)]
+    rng.shuffle(keys)
+    letters = "abcdefghijklmnopqrstuvwxyz0123456789@."
+    return {key: "".join(rng.choice(letters) for _ in range(value_length))
+            for key in keys}
+
+
+def _make_record(msg) -> logging.LogRecord:
+    """
+    Build an INFO record of the user_data logger.
+    """
+    return logging.LogRecord("user_data", logging.INFO, None, None,
+                             msg, None, None)
+
+
+def redaction_paths() -> Dict[str, Callable[[Dict[str, str]], object]]:
+    """
+    Build the redaction paths to measure, each taking one row.
+
+    :return: Mapping of path names to callables.
+    """
+    paths = {
+        "filter_datum": lambda row: filter_datum(
+            PII_FIELDS, RedactingFormatter.REDACTION, format_row(row),
+            RedactingFormatter.SEPARATOR),
+    }
+    for backend in REDACTION_BACKENDS:
+        formatter = RedactingFormatter(PII_FIELDS, backend=backend)
+        paths[f"formatter_{backend}"] = (
+            lambda row, fmt=formatter: fmt.format(_make_record(
+                format_row(row))))
+    json_formatter = JSONRedactingFormatter(PII_FIELDS)
+    paths["formatter_json"] = (
+        lambda row: json_formatter.format(_make_record(row)))
+    logger = get_logger()
+    for handler in logger.handlers:
+        handler.setStream(open(os.devnull, "w"))
+    paths["get_logger"] = lambda row: logger.info(format_row(row))
+    return paths
+
+
+def measure(func: Callable, rows: List[Dict[str, str]]) -> Dict[str, float]:
+    """
+    Measure one redaction path over a list of rows.
+
+    :param func: The redaction path.
+    :param rows: The rows fed to it.
+    :return: Records/sec, p50 and p99 latency in microseconds, and
+        bytes allocated at peak per record.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for row in rows:
+        before = time.perf_counter_ns()
+        func(row)
+        latencies.append(time.perf_counter_ns() - before)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    sample = rows[:min(len(rows), 200)]
+    tracemalloc.start()
+    peaks = 0
+    for row in sample:
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        func(row)
+        peaks += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    return {
+        "records_per_sec": len(rows) / elapsed,
+        "p50_us": latencies[len(latencies) // 2] / 1000,
+        "p99_us": latencies[int(len(latencies) * 0.99)] / 1000,
+        "alloc_bytes_per_record": peaks / len(sample),
+    }
+
+
+def run(field_counts: List[int] = (5, 20, 100),
+        value_lengths: List[int] = (8, 64),
+        pii_densities: List[float] = (0.1, 0.5),
+        records: int = 2000,
+        seed: int = 0
+        ) -> List[Dict]:
+    """
+    Measure every redaction path on every workload.
+
+    :param field_counts: Numbers of columns per row.
+    :param value_lengths: Lengths of the values.
+    :param pii_densities: Requested shares of PII columns; results
+        record the actual share, and a density giving the same rows as
+        an earlier one is skipped.
+    :param records: Number of rows per workload.
+    :param seed: Seed of the row generator.
+    :return: One result dict per (workload, path).
+    """
+    rng = random.Random(seed)
+    paths = redaction_paths()
+    results = []
+    for field_count in field_counts:
+        for value_length in value_lengths:
+            pii_counts = set()
+            for pii_density in pii_densities:
+                pii_count = pii_column_count(field_count, pii_density)
+                if pii_count in pii_counts:
+                    continue
+                pii_counts.add(pii_count)
+                rows = [build_row(field_count, value_length, pii_density,
+                                  rng) for _ in range(records)]
+                for name, func in paths.items():
+                    result = {
+                        "path": name,
+                        "fields": field_count,
+                        "value_length": value_length,
+                        "pii_density": pii_count / field_count,
+                        "pii_density_requested": pii_density,
+                    }
+                    result.update(measure(func, rows))
+                    results.append(result)
+    return results
+
+
+def main():
+    """
+    Run the suite, print a table and optionally write the JSON report.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the PII redaction paths")
+    parser.add_argument("--records", type=int, default=2000,
+                        help="rows per workload")
+    parser.add_argument("--output", help="file to write the JSON report to")
+    args = parser.parse_args()
+
+    results = run(records=args.records)
+    for r in results:
+        print(f"{r['path']:<16} fields={r['fields']:<4}"
+              f"len={r['value_length']:<3} pii={r['pii_density']:<5.2f}"
+              f"{r['records_per_sec']:>10.0f} rec/s"
+              f"  p50={r['p50_us']:.1f}us  p99={r['p99_us']:.1f}us"
+              f"  alloc={r['alloc_bytes_per_record']:.0f}B")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"created_at": time.time(), "results": results},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
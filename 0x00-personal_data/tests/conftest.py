@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Test configuration: import the project modules from the parent
+directory, with a fake MySQL connector when none is installed
+"""
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+try:
+    import mysql.connector  # noqa: F401
+except ImportError:
+    def _no_server(**kwargs):
+        """
+        Tests substitute their own connector for this one.
+        """
+        raise ConnectionError("No MySQL server in tests")
+
+    _connector = types.ModuleType("mysql.connector")
+    _connector.connect = _no_server
+    _mysql = types.ModuleType("mysql")
+    _mysql.connector = _connector
+    sys.modules["mysql"] = _mysql
+    sys.modules["mysql.connector"] = _connector
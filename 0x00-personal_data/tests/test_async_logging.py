@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Tests of the asynchronous logging pipeline
+"""
+import logging
+import threading
+import pytest
+import filtered_logger
+
+
+class SlowStream:
+    """
+    Stream counting the lines written to it, slowly.
+    """
+
+    def __init__(self):
+        """
+        Initialize the counter.
+        """
+        self.lines = 0
+
+    def write(self, text: str):
+        """
+        Count the lines of a write.
+        """
+        threading.Event().wait(0.0005)
+        self.lines += text.count("\n")
+
+    def flush(self):
+        """
+        Nothing buffered.
+        """
+
+
+def count_records_queued(monkeypatch, log_queue) -> list:
+    """
+    List the records put on a queue, the stop sentinel excluded.
+    """
+    enqueued = []
+    for name in ("put", "put_nowait"):
+        put = getattr(log_queue, name)
+
+        def counting_put(item, *args, put=put, **kwargs):
+            """
+            Count a record put on the queue.
+            """
+            put(item, *args, **kwargs)
+            if isinstance(item, logging.LogRecord):
+                enqueued.append(item)
+
+        monkeypatch.setattr(log_queue, name, counting_put)
+    return enqueued
+
+
+def test_shutdown_writes_every_record_logged_concurrently(monkeypatch):
+    """
+    Records logged while shutdown() runs are written or not queued,
+    and the logging thread never hangs on a full queue.
+    """
+    stream = SlowStream()
+    monkeypatch.setattr("sys.stderr", stream)
+    logger = filtered_logger.get_logger(asynchronous=True,
+                                        max_queue_size=8,
+                                        overflow="block")
+    handler = filtered_logger._queue_handler
+    enqueued = count_records_queued(monkeypatch, handler.queue)
+
+    def log_forever():
+        """
+        Log until the queue handler is detached.
+        """
+        while handler in logger.handlers:
+            logger.info("email=bob@x;")
+
+    thread = threading.Thread(target=log_forever, daemon=True)
+    thread.start()
+    threading.Event().wait(0.05)
+    filtered_logger.shutdown()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert stream.lines == len(enqueued)
+    assert logging.getLogger("user_data").handlers == []
+
+
+def test_record_racing_shutdown_is_written_or_refused(monkeypatch):
+    """
+    A record already in the handler when shutdown() detaches it is
+    either written or never queued.
+    """
+    stream = SlowStream()
+    monkeypatch.setattr("sys.stderr", stream)
+    logger = filtered_logger.get_logger(asynchronous=True,
+                                        max_queue_size=8,
+                                        overflow="block")
+    handler = filtered_logger._queue_handler
+    enqueued = count_records_queued(monkeypatch, handler.queue)
+    in_handler = threading.Event()
+    stopped = threading.Event()
+
+    def wait_for_shutdown(record) -> bool:
+        """
+        Hold the record in the handler until shutdown() returned.
+        """
+        in_handler.set()
+        stopped.wait(5)
+        return True
+
+    handler.addFilter(wait_for_shutdown)
+    thread = threading.Thread(target=logger.info, args=("email=bob@x;",))
+    thread.start()
+    assert in_handler.wait(5)
+    filtered_logger.shutdown()
+    stopped.set()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert stream.lines == len(enqueued)
+
+
+class BlockingStream(SlowStream):
+    """
+    Stream whose first write waits until it is released.
+    """
+
+    def __init__(self):
+        """
+        Initialize the counter and the events.
+        """
+        super().__init__()
+        self.writing = threading.Event()
+        self.released = threading.Event()
+
+    def write(self, text: str):
+        """
+        Count the lines of a write, the first one once released.
+        """
+        self.writing.set()
+        self.released.wait(5)
+        self.lines += text.count("\n")
+
+
+def test_handlers_of_earlier_calls_are_replaced(monkeypatch):
+    """
+    Each record is written once, on the logging thread only, after a
+    synchronous then an asynchronous get_logger.
+    """
+    stream = SlowStream()
+    monkeypatch.setattr("sys.stderr", stream)
+    # Leave out the capture handlers of pytest
+    monkeypatch.setattr(logging.getLogger("user_data"), "handlers", [])
+    filtered_logger.get_logger()
+    filtered_logger.get_logger()
+    logger = filtered_logger.get_logger(asynchronous=True)
+    assert logger.handlers == [filtered_logger._queue_handler]
+    logger.info("email=bob@x;")
+    filtered_logger.shutdown()
+    assert stream.lines == 1
+
+    logger = filtered_logger.get_logger()
+    assert len(logger.handlers) == 1
+    assert filtered_logger._queue_handler is None
+
+
+@pytest.mark.parametrize("overflow, written", [
+    ("drop-newest", ["0", "1", "2"]),
+    ("drop-oldest", ["0", "8", "9"]),
+])
+def test_drop_policies(monkeypatch, overflow, written):
+    """
+    With the listener stuck on the first record and room for two more,
+    the other records are dropped, the newest or the oldest ones, and
+    counted.
+    """
+    stream = BlockingStream()
+    monkeypatch.setattr("sys.stderr", stream)
+    logger = filtered_logger.get_logger(asynchronous=True,
+                                        max_queue_size=2,
+                                        overflow=overflow)
+    messages = []
+    formatter = filtered_logger._listener.handlers[0].formatter
+    monkeypatch.setattr(formatter, "format",
+                        lambda record: messages.append(record.msg) or "")
+    logger.info("0")
+    assert stream.writing.wait(5)
+    for i in range(1, 10):
+        logger.info(str(i))
+    assert filtered_logger.dropped_records() == 7
+    stream.released.set()
+    filtered_logger.shutdown()
+    assert messages == written
+    assert filtered_logger.dropped_records() == 0
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests of the calibrated bcrypt cost factor
+"""
+import json
+import os
+import pytest
+import encrypt_password
+
+
+def test_get_rounds_reads_each_file(tmp_path):
+    """
+    Each rounds file gives its own cost factor.
+    """
+    first, second = tmp_path / "first.json", tmp_path / "second.json"
+    first.write_text(json.dumps({"rounds": 5}))
+    second.write_text(json.dumps({"rounds": 6}))
+    assert encrypt_password.get_rounds(str(first)) == 5
+    assert encrypt_password.get_rounds(str(second)) == 6
+    assert encrypt_password.get_rounds(
+        str(tmp_path / "missing.json")) == encrypt_password.DEFAULT_ROUNDS
+
+
+def test_save_rounds_updates_the_cache(tmp_path):
+    """
+    get_rounds returns the value just saved to the same file.
+    """
+    path = str(tmp_path / "rounds.json")
+    assert encrypt_password.get_rounds(path) == \
+        encrypt_password.DEFAULT_ROUNDS
+    encrypt_password.save_rounds(7, path)
+    assert encrypt_password.get_rounds(path) == 7
+
+
+def test_default_file_is_next_to_the_module(monkeypatch, tmp_path):
+    """
+    The default rounds file does not depend on the working directory.
+    """
+    monkeypatch.chdir(tmp_path)
+    assert os.path.dirname(encrypt_password.ROUNDS_FILE) == \
+        os.path.dirname(os.path.abspath(encrypt_password.__file__))
+
+
+def test_calibrate_stops_before_overshooting(monkeypatch):
+    """
+    calibrate picks the highest cost factor whose hash fits the budget,
+    on a clock where each factor doubles the hashing time.
+    """
+    clock = [0.0]
+
+    def hashpw(password, salt):
+        """
+        Advance the clock by 2 ** (rounds - 4) milliseconds.
+        """
+        clock[0] += 2 ** (encrypt_password.hash_rounds(salt) - 4) / 1000
+        return salt
+
+    monkeypatch.setattr(encrypt_password.bcrypt, "hashpw", hashpw)
+    monkeypatch.setattr(encrypt_password.time, "perf_counter",
+                        lambda: clock[0])
+    assert encrypt_password.calibrate(target_ms=10) == 7
+    assert encrypt_password.calibrate(target_ms=20) == 8
+    assert encrypt_password.calibrate(target_ms=0.5) == \
+        encrypt_password.MIN_ROUNDS
+
+
+def test_needs_rehash():
+    """
+    Only hashes with a lower cost factor than the current one need a
+    new hash.
+    """
+    hashed = encrypt_password.hash_password("secret", rounds=4)
+    assert encrypt_password.hash_rounds(hashed) == 4
+    assert encrypt_password.needs_rehash(hashed, rounds=5)
+    assert not encrypt_password.needs_rehash(hashed, rounds=4)
+
+
+@pytest.mark.parametrize("rounds, password, valid, outdated", [
+    (4, "secret", True, True),
+    (5, "secret", True, False),
+    (4, "wrong", False, False),
+])
+def test_is_valid_reports_outdated_hashes(monkeypatch, rounds, password,
+                                          valid, outdated):
+    """
+    on_outdated is called with the hash of a valid password hashed with
+    a lower cost factor than the current one, 5 here, and only then.
+    """
+    monkeypatch.setattr(encrypt_password, "get_rounds", lambda: 5)
+    hashed = encrypt_password.hash_password("secret", rounds=rounds)
+    calls = []
+    assert encrypt_password.is_valid(hashed, password,
+                                     on_outdated=calls.append) is valid
+    assert calls == ([hashed] if outdated else [])
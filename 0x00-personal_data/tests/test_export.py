@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Tests of the streaming export of the users table
+"""
+import logging
+import tracemalloc
+import filtered_logger
+
+
+class FakeCursor:
+    """
+    Cursor over a generated users table, building each batch of rows
+    only when fetched, like an unbuffered server-side cursor.
+    """
+
+    def __init__(self, row_count: int):
+        """
+        Initialize the cursor.
+
+        :param row_count: Number of rows in the table.
+        """
+        self.row_count = row_count
+        self.position = 0
+        self.fetchall_calls = 0
+
+    def execute(self, query: str):
+        """
+        Start reading the table.
+        """
+        self.position = 0
+
+    def fetchmany(self, size: int):
+        """
+        Build the next rows of the table.
+        """
+        stop = min(self.position + size, self.row_count)
+        rows = [{"name": f"user{i}", "email": f"user{i}@hbtn.io",
+                 "phone": "0123456789", "ssn": "123-45-6789",
+                 "password": "x" * 32, "ip": "10.0.0.1",
+                 "last_login": "2024-05-30 12:00:00",
+                 "user_agent": "Mozilla/5.0"}
+                for i in range(self.position, stop)]
+        self.position = stop
+        return rows
+
+    def fetchall(self):
+        """
+        Build every remaining row at once.
+        """
+        self.fetchall_calls += 1
+        return self.fetchmany(self.row_count)
+
+    def close(self):
+        """
+        Nothing to release.
+        """
+
+
+class FakeConnection:
+    """
+    Connection handing out one FakeCursor.
+    """
+
+    def __init__(self, row_count: int):
+        """
+        Initialize the connection.
+
+        :param row_count: Number of rows in the users table.
+        """
+        self.cursor_ = FakeCursor(row_count)
+
+    def cursor(self, **kwargs):
+        """
+        Return the cursor of the users table.
+        """
+        return self.cursor_
+
+    def close(self):
+        """
+        Nothing to release.
+        """
+
+
+class NullStream:
+    """
+    Stream discarding what is written to it.
+    """
+
+    def write(self, text: str):
+        """
+        Discard the text.
+        """
+
+    def flush(self):
+        """
+        Nothing buffered.
+        """
+
+
+def peak_memory(func) -> int:
+    """
+    Peak memory allocated while running a function.
+
+    :param func: Function called without arguments.
+    :return: The peak, in bytes.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_iter_rows_memory_is_flat():
+    """
+    Streaming ten times more rows does not raise the peak memory.
+    """
+    def consume(row_count):
+        for _ in filtered_logger.iter_rows(FakeCursor(row_count), 100):
+            pass
+
+    small = peak_memory(lambda: consume(5000))
+    large = peak_memory(lambda: consume(50000))
+    assert large < small * 1.2 + 16 * 1024
+
+
+def test_main_memory_is_flat(monkeypatch):
+    """
+    main() logs every row through fetchmany with a flat peak memory.
+    """
+    monkeypatch.setenv("PERSONAL_DATA_BATCH_SIZE", "100")
+    monkeypatch.setattr("sys.stderr", NullStream())
+    # pytest attaches its capture handlers, which keep every record, to
+    # the non-propagating logger: main() must only write to sys.stderr
+    monkeypatch.setattr(logging.getLogger("user_data"), "handlers", [])
+    connections = []
+
+    def fake_db():
+        connections.append(FakeConnection(row_counts.pop(0)))
+        return connections[-1]
+
+    monkeypatch.setattr(filtered_logger, "get_db", fake_db)
+    row_counts = [2000, 2000, 20000]
+    # A first run allocates what is only created once
+    filtered_logger.main()
+    small = peak_memory(filtered_logger.main)
+    large = peak_memory(filtered_logger.main)
+    assert all(c.cursor_.position == c.cursor_.row_count
+               and not c.cursor_.fetchall_calls for c in connections)
+    assert large < small * 1.2 + 16 * 1024
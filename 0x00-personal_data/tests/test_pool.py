@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Tests of the connection pool, with a fake connector instead of MySQL
+"""
+import gc
+import threading
+import pytest
+import filtered_logger
+
+
+class FakeConnection:
+    """
+    Connection of the fake connector.
+    """
+
+    def __init__(self):
+        """
+        Initialize an open connection.
+        """
+        self.connected = True
+        self.closed = False
+
+    def is_connected(self) -> bool:
+        """
+        Whether the server still answers.
+        """
+        return self.connected
+
+    def cursor(self, **kwargs):
+        """
+        Cursors are not needed by these tests.
+        """
+        return None
+
+    def close(self):
+        """
+        Close the connection.
+        """
+        self.closed = True
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """
+    Make mysql.connector.connect open fake connections, listed in the
+    returned list, and start each test with no shared pool.
+    """
+    connections = []
+
+    def connect(**kwargs):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    monkeypatch.setattr(filtered_logger.mysql.connector, "connect", connect)
+    monkeypatch.setattr(filtered_logger, "_pool", None)
+    monkeypatch.setenv("PERSONAL_DATA_DB_POOL_SIZE", "2")
+    return connections
+
+
+def test_get_db_reuses_closed_connections(opened):
+    """
+    A closed connection is handed out again instead of a new one.
+    """
+    first = filtered_logger.get_db()
+    first.close()
+    second = filtered_logger.get_db()
+    assert second.is_connected()
+    second.close()
+    assert len(opened) == 1
+
+
+def test_get_db_never_blocks(opened):
+    """
+    Callers that never close their connections still get new ones
+    once the pool is exhausted.
+    """
+    dbs = []
+    thread = threading.Thread(
+        target=lambda: dbs.extend(filtered_logger.get_db()
+                                  for _ in range(6)))
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(dbs) == 6 and all(db.is_connected() for db in dbs)
+    assert len(opened) == 6
+
+
+def test_collected_connection_frees_its_slot(opened):
+    """
+    A proxy garbage-collected without close() frees its slot and its
+    connection is closed, not reused.
+    """
+    pool = filtered_logger.ConnectionPool(
+        filtered_logger.connect_db, size=1)
+    pool.acquire(timeout=0)
+    gc.collect()
+    again = pool.acquire(timeout=0)
+    assert opened[0].closed
+    assert again._connection is opened[1]
+
+
+def test_health_check_on_checkout(opened):
+    """
+    A connection that lost the server is replaced on checkout.
+    """
+    pool = filtered_logger.ConnectionPool(
+        filtered_logger.connect_db, size=1)
+    with pool.connection() as db:
+        pass
+    opened[0].connected = False
+    with pool.connection() as db:
+        assert db._connection is opened[1]
+    assert opened[0].closed
+
+
+def test_idle_connections_are_recycled(opened):
+    """
+    A connection idle for longer than max_idle is closed, not reused.
+    """
+    pool = filtered_logger.ConnectionPool(
+        filtered_logger.connect_db, size=1, max_idle=0)
+    with pool.connection():
+        pass
+    with pool.connection() as db:
+        assert db._connection is opened[1]
+    assert opened[0].closed
+
+
+def test_acquire_times_out(opened):
+    """
+    acquire() with a timeout raises when every slot is taken.
+    """
+    pool = filtered_logger.ConnectionPool(
+        filtered_logger.connect_db, size=1)
+    held = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.01)
+    held.close()
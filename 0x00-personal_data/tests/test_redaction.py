@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Differential tests of the redaction backends
+"""
+import json
+import logging
+import random
+import pytest
+from filtered_logger import (PII_FIELDS, REDACTION_BACKENDS, FieldScanner,
+                             JSONRedactingFormatter, RedactingFormatter,
+                             filter_datum)
+
+
+# Characters messages are built from: separators, `=` signs and parts
+# of field names are frequent so that edge cases come up
+ALPHABET = "aemnlpsw=;; =x_.@0"
+
+
+def random_message(rng: random.Random) -> str:
+    """
+    Build a random message mixing `key=value` pairs and noise.
+
+    :param rng: Seeded random generator.
+    :return: The message.
+    """
+    parts = []
+    for _ in range(rng.randint(0, 8)):
+        if rng.random() < 0.5:
+            key = rng.choice(PII_FIELDS + ("x", "id", ""))
+            prefix = "".join(rng.choice(ALPHABET)
+                             for _ in range(rng.randint(0, 3)))
+            value = "".join(rng.choice(ALPHABET)
+                            for _ in range(rng.randint(0, 6)))
+            parts.append(f"{prefix}{key}={value}")
+        else:
+            parts.append("".join(rng.choice(ALPHABET)
+                                 for _ in range(rng.randint(0, 10))))
+    return rng.choice([";", "; ", ""]).join(parts)
+
+
+@pytest.mark.parametrize("fields", [
+    PII_FIELDS,
+    ("email",),
+    ("e", "email", "mail"),
+    ("",),
+    (),
+])
+def test_scanner_matches_filter_datum(fields):
+    """
+    FieldScanner gives filter_datum's output on random messages.
+    """
+    rng = random.Random(1234)
+    scanner = FieldScanner(list(fields), "***", ";")
+    for _ in range(20000):
+        message = random_message(rng)
+        assert scanner.redact(message) == filter_datum(
+            list(fields), "***", message, ";"), message
+
+
+def test_formatter_backends_agree():
+    """
+    Both backends of RedactingFormatter format records identically.
+    """
+    rng = random.Random(42)
+    formatters = [RedactingFormatter(PII_FIELDS, backend=backend)
+                  for backend in REDACTION_BACKENDS]
+    for _ in range(2000):
+        message = random_message(rng)
+        record = logging.LogRecord("user_data", logging.INFO, None, None,
+                                   message, None, None)
+        lines = {formatter.format(record) for formatter in formatters}
+        assert len(lines) == 1, message
+
+
+@pytest.mark.parametrize("msg, masked", [
+    ({"email": "bob@x.io", "user": {"ssn": "1", "id": 7}},
+     {"email": "***", "user": {"ssn": "***", "id": 7}}),
+    ({"users": [{"email": "bob@x.io", "ssn": "1"}, {"id": 2}]},
+     {"users": [{"email": "***", "ssn": "***"}, {"id": 2}]}),
+    ({"batch": ({"rows": [[{"phone": "555"}]]}, "email=bob@x.io")},
+     {"batch": [{"rows": [[{"phone": "***"}]]}, "email=bob@x.io"]}),
+])
+def test_json_formatter_masks_nested_values(msg, masked):
+    """
+    Sensitive keys are masked in nested mappings and in the mappings
+    held by lists and tuples.
+    """
+    formatter = JSONRedactingFormatter(PII_FIELDS)
+    record = logging.LogRecord("user_data", logging.INFO, None, None,
+                               msg, None, None)
+    payload = json.loads(formatter.format(record))
+    for key in ("time", "logger", "level"):
+        del payload[key]
+    assert payload == masked
@@ -8,7 +8,7 @@ from flask import Flask, jsonify, abort, request
 from flask_cors import (CORS, cross_origin)
 import os
 from api.v1.auth.basic_auth import BasicAuth
-from api.v1.auth.auth import Auth
+from api.v1.auth.auth import Auth, PathMatcher
 from api.v1.auth.session_auth import SessionAuth
 
 
@@ -19,6 +19,12 @@ CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 # Initialize the auth variable
 auth = None
 
+# Paths served without authentication, compiled once
+excluded_paths = PathMatcher(['/api/v1/status/',
+                              '/api/v1/unauthorized/',
+                              '/api/v1/forbidden/',
+                              '/api/v1/auth_session/login/'])
+
 
 # Load the appropriate authentication class based on AUTH_TYPE
 auth_type = os.getenv('AUTH_TYPE')
@@ -28,6 +34,12 @@ if auth_type == 'basic_auth':
 elif auth_type == 'session_auth':
     from api.v1.auth.session_auth import SessionAuth
     auth = SessionAuth()
+elif auth_type == 'session_db_auth':
+    from api.v1.auth.session_db_auth import SessionDBAuth
+    auth = SessionDBAuth()
+
+# Views reach the auth through the app, whatever the module was run as
+app.extensions["auth"] = auth
 
 
 @app.before_request
@@ -35,16 +47,17 @@ def before_request():
     """ Filter each request before"""
     if auth is None:
         return
-    excluded_paths = ['/api/v1/status/',
-                      '/api/v1/unauthorized/',
-                      '/api/v1/forbidden/',
-                      '/api/v1/auth_session/login/']
     if not auth.require_auth(request.path, excluded_paths):
         return
     if (auth.authorization_header(request) is None and
             auth.session_cookie(request) is None):
         abort(401)
-    request.current_user = auth.current_user(request)
+    principal = auth.current_principal(request)
+    request.current_principal = principal
+    if principal is not None:
+        request.current_user = principal.user
+    else:
+        request.current_user = auth.current_user(request)
 
 
 @app.errorhandler(404)
@@ -2,10 +2,73 @@
 """
 create a class to manage the API authentication
 """
-from typing import List, TypeVar
+from functools import lru_cache
+import os
+from typing import Iterable, List, TypeVar, Union
 from flask import request
 
 
+class PathMatcher:
+    """
+    Compiled list of paths excluded from authentication.
+
+    Paths ending with '/' are matched exactly, through a set; paths
+    ending with '*' match every path starting with what precedes the
+    '*', through a prefix trie. Like Auth.require_auth always did,
+    requested paths are compared with a trailing slash.
+    """
+    # Key marking the end of a prefix in a trie node
+    END = None
+
+    def __init__(self, paths: Iterable[str]):
+        """
+        Compiles the excluded paths.
+        """
+        self.exact = set()
+        self.trie = {}
+        self.size = 0
+        for path in paths:
+            if not isinstance(path, str):
+                continue
+            if path.endswith('*'):
+                node = self.trie
+                for char in path[:-1]:
+                    node = node.setdefault(char, {})
+                node[self.END] = True
+            elif path.endswith('/'):
+                self.exact.add(path)
+            else:
+                continue
+            self.size += 1
+
+    def __len__(self) -> int:
+        """ Number of compiled paths """
+        return self.size
+
+    def matches(self, path: str) -> bool:
+        """ Tell whether a path is excluded """
+        if not path.endswith('/'):
+            path += '/'
+        if path in self.exact:
+            return True
+        node = self.trie
+        if not node:
+            return False
+        for char in path:
+            if self.END in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return self.END in node
+
+
+@lru_cache(maxsize=32)
+def _compile_paths(paths: tuple) -> PathMatcher:
+    """ Compile a list of excluded paths once """
+    return PathMatcher(paths)
+
+
 class Auth:
     """
     Class to manage the API authentication.
@@ -21,22 +84,20 @@ class Auth:
         """
         pass
 
-    def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
-        """ Determine if authentication is required """
+    def require_auth(self, path: str,
+                     excluded_paths: Union[List[str], PathMatcher]) -> bool:
+        """ Determine if authentication is required
+
+        excluded_paths is a PathMatcher or a list of paths, compiled into
+        one on first use
+        """
         if path is None:
             return True
         if excluded_paths is None or not excluded_paths:
             return True
-
-        # Ensure path ends with a slash for comparison
-        if not path.endswith('/'):
-            path += '/'
-
-        # Check if the normalized path is in excluded_paths
-        for excluded_path in excluded_paths:
-            if excluded_path.endswith('/') and path == excluded_path:
-                return False
-        return True
+        if not isinstance(excluded_paths, PathMatcher):
+            excluded_paths = _compile_paths(tuple(excluded_paths))
+        return not excluded_paths.matches(path)
 
     def authorization_header(self, request=None) -> str:
         """ Get the authorization header from the request """
@@ -48,6 +109,11 @@ class Auth:
         """ Get the current user """
         return None
 
+    def current_principal(self, request=None) -> TypeVar('Principal'):
+        """ Get the cached principal of the current user, None when the
+        authentication does not cache them """
+        return None
+
     def session_cookie(self, request=None):
         """ Returns the value of the session cookie """
         if request is None:
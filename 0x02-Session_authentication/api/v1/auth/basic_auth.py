@@ -3,24 +3,159 @@
 class BasicAuth that inherits from Auth
 """
 import base64
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
 from api.v1.auth.auth import Auth
 from models.user import User
 from typing import Optional, TypeVar
 
 
+class CredentialCache:
+    """
+    Bounded cache of the Authorization headers already verified.
+
+    Entries are keyed by a keyed BLAKE2 hash of the header under a per-process
+    secret, so the cache never holds the credentials themselves, and
+    map to the id, email and password hash the user had when verified.
+    An entry expires after `ttl` seconds and the least recently used
+    one is evicted when `max_size` are held. A hit is only served while
+    the user still exists with the same email and password hash, so a
+    password change or a removal invalidates the user's entries.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        """
+        Initializes the cache.
+
+        Args:
+            max_size (int): Maximum number of entries, 0 disables it.
+            ttl (float): Lifetime of an entry in seconds.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, authorization_header: str) -> bytes:
+        """
+        Computes the cache key of an Authorization header.
+
+        Args:
+            authorization_header (str): The Authorization header.
+
+        Returns:
+            bytes: The keyed hash of the header.
+        """
+        return hashlib.blake2b(authorization_header.encode(),
+                               key=self._secret, digest_size=16).digest()
+
+    def get(self, authorization_header: str) -> Optional[User]:
+        """
+        Returns the user a header was verified for.
+
+        Args:
+            authorization_header (str): The Authorization header.
+
+        Returns:
+            User: The user if the header is cached and still valid
+            for it, else None.
+        """
+        if not self.max_size:
+            return None
+        key = self.key(authorization_header)
+        entry = self._entries.get(key)
+        user = None
+        if entry is not None and entry[3] > time.monotonic():
+            user = User.get(entry[0])
+            if user is not None and (user.email != entry[1] or
+                                     user.password != entry[2]):
+                user = None
+        with self._lock:
+            if user is not None:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                if entry is not None:
+                    self._entries.pop(key, None)
+                self.misses += 1
+        return user
+
+    def put(self, authorization_header: str, user: User):
+        """
+        Records that a header was verified for a user.
+
+        Args:
+            authorization_header (str): The Authorization header.
+            user (User): The authenticated user.
+        """
+        if not self.max_size:
+            return
+        key = self.key(authorization_header)
+        entry = (user.id, user.email, user.password,
+                 time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, authorization_header: str):
+        """
+        Drops the entry of a header.
+
+        Args:
+            authorization_header (str): The Authorization header.
+        """
+        key = self.key(authorization_header)
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Drops every entry and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            dict: The number of entries, hits and misses.
+        """
+        with self._lock:
+            return {"size": len(self._entries),
+                    "hits": self.hits,
+                    "misses": self.misses}
+
+
 class BasicAuth(Auth):
     """
     BasicAuth class that provides Basic Authentication methods.
 
     This class inherits from Auth and provides methods to handle
-    Basic Authentication headers.
+    Basic Authentication headers. Verified headers are kept in a
+    CredentialCache sized by BASIC_AUTH_CACHE_SIZE and expiring after
+    BASIC_AUTH_CACHE_TTL seconds.
     """
 
     def __init__(self):
         """
-        Initializes the Auth class.
+        Initializes the BasicAuth class.
         """
-        pass
+        self.credential_cache = CredentialCache(
+            int(os.getenv("BASIC_AUTH_CACHE_SIZE", 1024)),
+            float(os.getenv("BASIC_AUTH_CACHE_TTL", 300)))
 
     def extract_base64_authorization_header(self,
                                             authorization_header: str
@@ -146,6 +281,11 @@ class BasicAuth(Auth):
         if not auth_header or not auth_header.startswith('Basic '):
             return None
 
+        # Repeated headers skip decoding, searching and hashing
+        user = self.credential_cache.get(auth_header)
+        if user is not None:
+            return user
+
         base64_auth_header = auth_header.split(' ')[1]
 
         decoded_auth_header = self.decode_base64_authorization_header(
@@ -160,5 +300,7 @@ class BasicAuth(Auth):
             return None
 
         user = self.user_object_from_credentials(user_email, user_pwd)
+        if user is not None:
+            self.credential_cache.put(auth_header, user)
 
         return user
@@ -3,15 +3,322 @@
 SessionAuth module
 """
 from api.v1.auth.auth import Auth
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
 import uuid
+import weakref
+from models.base import write_listeners
 from models.user import User
 
 
+def env_number(name: str, default: int) -> int:
+    """
+    Read an integer from the environment, default if unset or invalid
+    """
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class SessionStore:
+    """
+    Sessions in memory: session ID -> user ID, in least recently used
+    order, with the session IDs of each user.
+
+    A session expires `duration` seconds after its creation (never if
+    `duration` is not positive): lookups drop expired sessions, and all
+    of them are swept at most every `sweep_interval` seconds. Past
+    `max_size` sessions, the least recently used one is evicted.
+    """
+
+    def __init__(self, duration: int = 0, max_size: int = 100000,
+                 sweep_interval: int = 60):
+        """
+        Initialize an empty store
+        """
+        self.duration = duration
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        # session ID -> (user ID, creation time)
+        self._sessions = OrderedDict()
+        # user ID -> set of session IDs
+        self._by_user = {}
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        """
+        Whether a session created at `created_at` is expired
+        """
+        return self.duration > 0 and created_at + self.duration < now
+
+    def _drop(self, session_id: str):
+        """
+        Remove a session, lock held
+        """
+        user_id, _ = self._sessions.pop(session_id)
+        session_ids = self._by_user.get(user_id)
+        if session_ids is not None:
+            session_ids.discard(session_id)
+            if not session_ids:
+                del self._by_user[user_id]
+
+    def _maybe_sweep(self, now: float):
+        """
+        Sweep the expired sessions if the last sweep is old enough,
+        lock held
+        """
+        if self.duration <= 0 or now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        expired = [session_id for session_id, (_, created_at)
+                   in self._sessions.items()
+                   if self._expired(created_at, now)]
+        for session_id in expired:
+            self._drop(session_id)
+
+    def create(self, user_id: str) -> str:
+        """
+        Create a session for a user, returns its ID
+        """
+        session_id = str(uuid.uuid4())
+        self.put(session_id, user_id)
+        return session_id
+
+    def put(self, session_id: str, user_id: str, age: float = 0):
+        """
+        Store a session of a user, created `age` seconds ago
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_sweep(now)
+            if session_id in self._sessions:
+                self._drop(session_id)
+            self._sessions[session_id] = (user_id, now - age)
+            self._by_user.setdefault(user_id, set()).add(session_id)
+            while len(self._sessions) > self.max_size > 0:
+                self._drop(next(iter(self._sessions)))
+
+    def get(self, session_id: str, default: str = None) -> str:
+        """
+        Return the user ID of a session, default if it does not exist
+        or is expired
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_sweep(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return default
+            if self._expired(entry[1], now):
+                self._drop(session_id)
+                return default
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Delete a session, returns False if it did not exist
+        """
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._drop(session_id)
+            return True
+
+    def delete_user(self, user_id: str) -> int:
+        """
+        Delete every session of a user, returns how many there were
+        """
+        with self._lock:
+            session_ids = self._by_user.pop(user_id, ())
+            for session_id in session_ids:
+                del self._sessions[session_id]
+            return len(session_ids)
+
+    def clear(self):
+        """
+        Delete every session
+        """
+        with self._lock:
+            self._sessions.clear()
+            self._by_user.clear()
+
+    def sweep(self):
+        """
+        Delete every expired session now
+        """
+        with self._lock:
+            self._last_sweep = float("-inf")
+            self._maybe_sweep(time.monotonic())
+
+    def __getitem__(self, session_id: str) -> str:
+        """
+        User ID of a session, raises KeyError if it does not exist or
+        is expired
+        """
+        user_id = self.get(session_id)
+        if user_id is None:
+            raise KeyError(session_id)
+        return user_id
+
+    def __contains__(self, session_id: str) -> bool:
+        """
+        Whether a session exists and is not expired
+        """
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        """
+        Number of sessions held, expired ones not swept yet included
+        """
+        return len(self._sessions)
+
+
+class Principal:
+    """
+    What requests of a session need to know of its user, computed once:
+    the user, its ID, display name and serialized JSON
+    """
+    __slots__ = ('user', 'id', 'display_name', 'json')
+
+    def __init__(self, user: User):
+        """
+        Build the principal of a user
+        """
+        self.user = user
+        self.id = user.id
+        self.display_name = user.display_name()
+        self.json = json.dumps(user.to_json()).encode()
+
+
+class PrincipalCache:
+    """
+    Principals by user ID, shared by the sessions of each user, in
+    least recently used order. A principal is rebuilt after `ttl`
+    seconds, which bounds how long writes of other processes go
+    unnoticed; writes of this process drop it at once
+    """
+
+    def __init__(self, max_size: int = 100000, ttl: int = 60):
+        """
+        Initialize an empty cache
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        # user ID -> (principal, creation time)
+        self._principals = OrderedDict()
+        # user ID -> number of invalidations, reset with a new epoch
+        # once it holds more than max_size users
+        self._versions = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Principal:
+        """
+        Return the principal of a user, building it if needed, None if
+        the user does not exist. A principal built while the user was
+        invalidated is returned but not cached
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._principals.get(user_id)
+            if entry is not None and (self.ttl <= 0 or
+                                      entry[1] + self.ttl >= now):
+                self._principals.move_to_end(user_id)
+                return entry[0]
+            version = (self._epoch, self._versions.get(user_id, 0))
+        user = User.get(user_id)
+        if user is None:
+            return None
+        principal = Principal(user)
+        with self._lock:
+            if version != (self._epoch, self._versions.get(user_id, 0)):
+                return principal
+            self._principals[user_id] = (principal, now)
+            self._principals.move_to_end(user_id)
+            while len(self._principals) > self.max_size > 0:
+                self._principals.popitem(last=False)
+        return principal
+
+    def invalidate(self, user_id: str):
+        """
+        Drop the principal of a user, and any being built
+        """
+        with self._lock:
+            self._principals.pop(user_id, None)
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            if len(self._versions) > max(self.max_size, 1):
+                self._versions.clear()
+                self._epoch += 1
+
+    def on_write(self, operation: str, obj):
+        """
+        Write listener of the models: drop the principal of a user
+        saved or removed
+        """
+        if isinstance(obj, User):
+            self.invalidate(obj.id)
+
+    def __len__(self) -> int:
+        """
+        Number of principals held
+        """
+        return len(self._principals)
+
+
+# Principal caches of the live SessionAuth instances
+_principal_caches = weakref.WeakSet()
+
+
+def _invalidate_principals(operation: str, obj):
+    """
+    Write listener of the models, registered once: tell the principal
+    caches of the writes
+    """
+    for principals in list(_principal_caches):
+        principals.on_write(operation, obj)
+
+
+write_listeners.append(_invalidate_principals)
+
+
 class SessionAuth(Auth):
     """
     Session authentication class
+
+    Sessions last SESSION_DURATION seconds (forever if unset or 0), and
+    at most SESSION_MAX_SIZE (default 100000) of them are kept; expired
+    ones are swept every SESSION_SWEEP_INTERVAL seconds (default 60).
+    The principal of each user with a session is cached, and rebuilt
+    when the user is saved or removed, or after SESSION_PRINCIPAL_TTL
+    seconds (default 60)
     """
-    user_id_by_session_id = {}
+
+    def __init__(self):
+        """
+        Initialize the session store and the principal cache
+        """
+        self.session_store = SessionStore(
+            env_number("SESSION_DURATION", 0),
+            env_number("SESSION_MAX_SIZE", 100000),
+            env_number("SESSION_SWEEP_INTERVAL", 60))
+        self.principals = PrincipalCache(
+            env_number("SESSION_MAX_SIZE", 100000),
+            env_number("SESSION_PRINCIPAL_TTL", 60))
+        _principal_caches.add(self.principals)
+
+    @property
+    def user_id_by_session_id(self) -> SessionStore:
+        """
+        The session store, which can be read like the dict of user IDs
+        by session ID it replaces
+        """
+        return self.session_store
 
     def create_session(self, user_id: str = None) -> str:
         """
@@ -20,9 +327,7 @@ class SessionAuth(Auth):
         if user_id is None or not isinstance(user_id, str):
             return None
 
-        session_id = str(uuid.uuid4())
-        self.user_id_by_session_id[session_id] = user_id
-        return session_id
+        return self.session_store.create(user_id)
 
     def user_id_for_session_id(self, session_id: str = None) -> str:
         """
@@ -30,11 +335,11 @@ class SessionAuth(Auth):
         """
         if session_id is None or not isinstance(session_id, str):
             return None
-        return self.user_id_by_session_id.get(session_id)
+        return self.session_store.get(session_id)
 
-    def current_user(self, request=None):
+    def current_principal(self, request=None) -> Principal:
         """
-        Retrieve the User instance based on the cookie value
+        Retrieve the cached principal based on the cookie value
         """
         session_id = self.session_cookie(request)
         if session_id is None:
@@ -42,4 +347,31 @@ class SessionAuth(Auth):
         user_id = self.user_id_for_session_id(session_id)
         if user_id is None:
             return None
-        return User.get(user_id)
+        return self.principals.get(user_id)
+
+    def current_user(self, request=None):
+        """
+        Retrieve the User instance based on the cookie value
+        """
+        principal = self.current_principal(request)
+        if principal is None:
+            return None
+        return principal.user
+
+    def destroy_session(self, request=None) -> bool:
+        """
+        Delete the session of the request, to log out
+        """
+        if request is None:
+            return False
+        session_id = self.session_cookie(request)
+        if session_id is None:
+            return False
+        return self.session_store.delete(session_id)
+
+    def destroy_user_sessions(self, user_id: str) -> int:
+        """
+        Delete every session of a user, returns how many there were
+        """
+        self.principals.invalidate(user_id)
+        return self.session_store.delete_user(user_id)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+SessionDBAuth module
+"""
+from api.v1.auth.session_auth import SessionAuth, SessionStore, env_number
+from datetime import datetime, timedelta
+import threading
+import time
+import uuid
+from models.user_session import UserSession
+
+
+class SessionDBAuth(SessionAuth):
+    """
+    Session authentication storing the sessions as UserSession objects,
+    so they survive restarts and are shared by the workers using the
+    same storage (MODELS_STORAGE=sqlite or json_shared)
+
+    Sessions read from the storage are cached in the process for at most
+    SESSION_DB_CACHE_TTL seconds (default 5, 0 disables the cache) and
+    never past their expiry. The cache is dropped whenever a UserSession
+    is removed, by this worker or another, so a destroyed session is
+    refused at once; logins leave it in place. At most
+    SESSION_DB_CACHE_SIZE sessions (default 10000) are cached
+    """
+
+    def __init__(self):
+        """
+        Load the sessions and initialize the cache
+        """
+        super().__init__()
+        self.session_duration = env_number("SESSION_DURATION", 0)
+        self.sweep_interval = env_number("SESSION_SWEEP_INTERVAL", 60)
+        self.cache_ttl = env_number("SESSION_DB_CACHE_TTL", 5)
+        # Read-through cache of the stored sessions
+        self.session_store = SessionStore(
+            self.cache_ttl,
+            env_number("SESSION_DB_CACHE_SIZE", 10000),
+            self.sweep_interval)
+        self._last_sweep = time.monotonic()
+        # Removals of stored sessions when the cache was filled
+        self._removals = None
+        self._removals_lock = threading.Lock()
+        UserSession.load_from_file()
+
+    def _check_removals(self):
+        """
+        Drop the cache if stored sessions were removed since it was
+        filled, returns the current count of removals
+        """
+        removals = UserSession.removals()
+        with self._removals_lock:
+            if removals != self._removals:
+                self.session_store.clear()
+                self._removals = removals
+        return removals
+
+    def _remaining(self, user_session: UserSession) -> float:
+        """
+        Seconds before a stored session expires, None if it never does
+        """
+        if self.session_duration <= 0:
+            return None
+        expires_at = (user_session.created_at +
+                      timedelta(seconds=self.session_duration))
+        return (expires_at - datetime.utcnow()).total_seconds()
+
+    def _cache(self, session_id: str, user_id: str, remaining: float,
+               removals):
+        """
+        Cache a stored session read after `removals` removals, until it
+        expires at the latest
+        """
+        if self.cache_ttl <= 0:
+            return
+        age = 0
+        if remaining is not None and remaining < self.cache_ttl:
+            age = self.cache_ttl - remaining
+        with self._removals_lock:
+            # Not if sessions were removed since it was read
+            if removals == self._removals:
+                self.session_store.put(session_id, user_id, age)
+
+    def sweep_expired_sessions(self) -> int:
+        """
+        Remove the expired sessions from the storage, returns how many
+        """
+        if self.session_duration <= 0:
+            return 0
+        expired = [user_session for user_session in UserSession.iter()
+                   if self._remaining(user_session) < 0]
+        with UserSession.batch():
+            for user_session in expired:
+                user_session.remove()
+        return len(expired)
+
+    def create_session(self, user_id: str = None) -> str:
+        """
+        Create and store a session for a user_id
+        """
+        if user_id is None or not isinstance(user_id, str):
+            return None
+
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            self.sweep_expired_sessions()
+        session_id = str(uuid.uuid4())
+        UserSession(user_id=user_id, session_id=session_id).save()
+        # Just stored, so valid whatever was removed before
+        self._cache(session_id, user_id, self.session_duration or None,
+                    self._removals)
+        return session_id
+
+    def user_id_for_session_id(self, session_id: str = None) -> str:
+        """
+        Returns a User ID based on a Session ID, from the cache or else
+        from the storage
+        """
+        if session_id is None or not isinstance(session_id, str):
+            return None
+        removals = self._check_removals()
+        user_id = self.session_store.get(session_id)
+        if user_id is not None:
+            return user_id
+
+        user_sessions = UserSession.search({"session_id": session_id})
+        if not user_sessions:
+            return None
+        user_session = user_sessions[0]
+        remaining = self._remaining(user_session)
+        if remaining is not None and remaining < 0:
+            user_session.remove()
+            return None
+        self._cache(session_id, user_session.user_id, remaining, removals)
+        return user_session.user_id
+
+    def destroy_session(self, request=None) -> bool:
+        """
+        Delete the session of the request, to log out
+        """
+        if request is None:
+            return False
+        session_id = self.session_cookie(request)
+        if session_id is None:
+            return False
+        self.session_store.delete(session_id)
+        user_sessions = UserSession.search({"session_id": session_id})
+        for user_session in user_sessions:
+            user_session.remove()
+        return len(user_sessions) > 0
+
+    def destroy_user_sessions(self, user_id: str) -> int:
+        """
+        Delete every session of a user, returns how many there were
+        """
+        self.principals.invalidate(user_id)
+        self.session_store.delete_user(user_id)
+        user_sessions = UserSession.search({"user_id": user_id})
+        with UserSession.batch():
+            for user_session in user_sessions:
+                user_session.remove()
+        return len(user_sessions)
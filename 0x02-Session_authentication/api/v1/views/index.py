@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """ Module of Index views
 """
-from flask import jsonify, abort
+from flask import jsonify, abort, request
 from api.v1.views import app_views
 
 
@@ -18,12 +18,19 @@ def status() -> str:
 def stats() -> str:
     """ GET /api/v1/stats
     Return:
-      - the number of each objects
+      - the number of each objects, of users per creation day and of
+        users with a name, read from the counters of the storage
+      - 304 when the If-None-Match header holds the current ETag
     """
     from models.user import User
     stats = {}
     stats['users'] = User.count()
-    return jsonify(stats)
+    stats['users_by_creation_day'] = User.aggregate('by_creation_day')
+    stats['users_with_name'] = User.aggregate('with_name').get(True, 0)
+    response = jsonify(stats)
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @app_views.route('/unauthorized', methods=['GET'], strict_slashes=False)
@@ -1,20 +1,76 @@
 #!/usr/bin/env python3
 """ Module of Users views
 """
+from api.v1.auth.session_auth import SessionAuth
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import Response, abort, current_app, jsonify, request
 from models.user import User
+import json
 import os
+from typing import Iterator
+
+
+# Largest page served, whatever the requested limit
+MAX_LIMIT = int(os.getenv("USERS_MAX_LIMIT", 1000))
+
+
+def all_users() -> Iterator[User]:
+    """ Every user in ID order, read one page of MAX_LIMIT users at a
+    time so that only a page is held
+    """
+    after = None
+    while True:
+        users = User.page(after, MAX_LIMIT)
+        yield from users
+        if len(users) < MAX_LIMIT:
+            return
+        after = users[-1].id
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters:
+      - limit (optional): maximum number of users returned, at most
+        MAX_LIMIT, which is also the default with a cursor
+      - cursor (optional): value of the X-Next-Cursor header of the
+        previous page, the ID of its last user
     Return:
-      - list of all User objects JSON represented
+      - list of User objects JSON represented, streamed in ID order:
+        one page with a limit or a cursor, else every user, read
+        MAX_LIMIT at a time
+      - 400 if limit is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    cursor = request.args.get('cursor') or None
+    try:
+        limit = request.args.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return jsonify({'error': "Wrong cursor or limit"}), 400
+    if limit is not None and limit < 1:
+        return jsonify({'error': "Wrong cursor or limit"}), 400
+
+    next_cursor = None
+    if limit is None and cursor is None:
+        users = all_users()
+    else:
+        limit = min(limit or MAX_LIMIT, MAX_LIMIT)
+        # Keyset page: one more user tells whether another page follows
+        users = User.page(cursor, limit + 1)
+        if len(users) > limit:
+            users.pop()
+            next_cursor = users[-1].id
+
+    def generate():
+        yield '['
+        for i, user in enumerate(users):
+            yield (',' if i else '') + json.dumps(user.to_json())
+        yield ']'
+
+    response = Response(generate(), mimetype='application/json')
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -29,12 +85,16 @@ def view_one_user(user_id: str = None) -> str:
     if user_id == "me":
         if request.current_user is None:
             abort(404)
-        return jsonify(request.current_user.to_dict())
+        principal = getattr(request, "current_principal", None)
+        if principal is not None:
+            # Serialized once per user, until it is saved or removed
+            return Response(principal.json, mimetype="application/json")
+        return jsonify(request.current_user.to_json())
 
-    user = storage.get(User, user_id)
+    user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_dict())
+    return jsonify(user.to_json())
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
@@ -52,6 +112,10 @@ def delete_user(user_id: str = None) -> str:
     if user is None:
         abort(404)
     user.remove()
+    # The auth of the app serving the request, set by api.v1.app
+    auth = current_app.extensions.get("auth")
+    if isinstance(auth, SessionAuth):
+        auth.destroy_user_sessions(user.id)
     return jsonify({}), 200
 
 
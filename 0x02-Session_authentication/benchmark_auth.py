@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+""" Benchmark of the route exclusion of Auth.require_auth
+"""
+import sys
+import timeit
+from typing import List
+from api.v1.auth.auth import Auth, PathMatcher
+
+
+def excluded_routes(count: int) -> List[str]:
+    """ `count` excluded routes, a tenth of them prefix wildcards
+    """
+    routes = []
+    for i in range(count):
+        if i % 10 == 0:
+            routes.append("/api/v1/public_{}/*".format(i))
+        else:
+            routes.append("/api/v1/resource_{}/".format(i))
+    return routes
+
+
+def scan_require_auth(path: str, excluded_paths: List[str]) -> bool:
+    """ Auth.require_auth before compiling: a loop over every route
+    """
+    if path is None or not excluded_paths:
+        return True
+    if not path.endswith('/'):
+        path += '/'
+    for excluded_path in excluded_paths:
+        if excluded_path.endswith('/') and path == excluded_path:
+            return False
+    return True
+
+
+def require_auth_us(count: int = 1000, number: int = 20000) -> dict:
+    """ Microseconds per require_auth call on `count` excluded routes,
+    for a path matched exactly, one matched by a wildcard and one
+    not excluded
+    """
+    routes = excluded_routes(count)
+    matcher = PathMatcher(routes)
+    auth = Auth()
+    paths = {
+        "exact": "/api/v1/resource_{}".format(count - 1),
+        "wildcard": "/api/v1/public_0/items/42",
+        "not excluded": "/api/v1/users/42",
+    }
+    results = {}
+    for name, path in paths.items():
+        results[name] = {
+            "scan": timeit.timeit(
+                lambda: scan_require_auth(path, routes),
+                number=number) / number * 1e6,
+            "compiled": timeit.timeit(
+                lambda: auth.require_auth(path, matcher),
+                number=number) / number * 1e6,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    for name, timings in require_auth_us(count).items():
+        print("{} path, {} routes: scan {:.2f}us, compiled {:.2f}us".format(
+            name, count, timings["scan"], timings["compiled"]))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+""" Benchmarks of the file-backed models
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+import uuid
+import models.base
+from datetime import datetime
+from models.base import TIMESTAMP_FORMAT
+from models.user import User
+
+
+class DictUser():
+    """ User as it was before `__slots__`: a plain object holding every
+    attribute in `__dict__`, built by the original Base and User
+    `__init__`
+    """
+
+    def __init__(self, *args: list, **kwargs: dict):
+        """ Initialize a DictUser instance
+        """
+        self.id = kwargs.get('id', str(uuid.uuid4()))
+        if kwargs.get('created_at') is not None:
+            self.created_at = datetime.strptime(kwargs.get('created_at'),
+                                                TIMESTAMP_FORMAT)
+        else:
+            self.created_at = datetime.utcnow()
+        if kwargs.get('updated_at') is not None:
+            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
+                                                TIMESTAMP_FORMAT)
+        else:
+            self.updated_at = datetime.utcnow()
+        self.email = kwargs.get('email')
+        self._password = kwargs.get('_password')
+        self.first_name = kwargs.get('first_name')
+        self.last_name = kwargs.get('last_name')
+
+
+def user_rows(count: int) -> list:
+    """ Serialized users, as stored in .db_User.json
+    """
+    return [{
+        'id': "{:036d}".format(i),
+        'created_at': "2024-05-{:02d}T12:{:02d}:{:02d}".format(
+            i % 28 + 1, i // 60 % 60, i % 60),
+        'updated_at': "2024-06-{:02d}T08:{:02d}:{:02d}".format(
+            i % 28 + 1, i // 60 % 60, i % 60),
+        'email': "user{}@hbtn.io".format(i),
+        '_password': "{:064x}".format(i),
+        'first_name': "First",
+        'last_name': "Last",
+    } for i in range(count)]
+
+
+def bytes_per_user(cls: type, count: int = 100000) -> float:
+    """ Average memory held by one loaded user of the given class
+    """
+    rows = user_rows(count)
+    models.base.parse_timestamp.cache_clear()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    users = [cls(**row) for row in rows]
+    # Entries of the timestamp cache are not held by the users
+    models.base.parse_timestamp.cache_clear()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del users
+    return (after - before) / count
+
+
+def cold_load_seconds(count: int, lazy: bool) -> float:
+    """ Time User.load_from_file on a file of `count` users, with eager
+    or lazy timestamp parsing
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            with open(".db_User.json", 'w') as f:
+                json.dump({row['id']: row for row in user_rows(count)}, f)
+            models.base.LAZY_TIMESTAMPS = lazy
+            models.base.parse_timestamp.cache_clear()
+            start = time.perf_counter()
+            User.load_from_file()
+            return time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+
+def timestamp_parse_us(number: int = 100000) -> dict:
+    """ Microseconds per timestamp parse, strptime against the fast path
+    """
+    value = "2024-05-30T12:00:00"
+    fast = models.base.parse_timestamp.__wrapped__
+    return {
+        "strptime": timeit.timeit(
+            lambda: datetime.strptime(value, TIMESTAMP_FORMAT),
+            number=number) / number * 1e6,
+        "parse_timestamp": timeit.timeit(
+            lambda: fast(value), number=number) / number * 1e6,
+    }
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    for cls in (DictUser, User):
+        print("{}: {:.0f} bytes per user".format(cls.__name__,
+                                                 bytes_per_user(cls)))
+    for name, usec in timestamp_parse_us().items():
+        print("{}: {:.2f}us per timestamp".format(name, usec))
+    for lazy in (False, True):
+        print("load {} users ({} timestamps): {:.2f}s".format(
+            count, "lazy" if lazy else "eager",
+            cold_load_seconds(count, lazy)))
@@ -2,19 +2,68 @@
 """ Base module
 """
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
-import json
+from functools import lru_cache
+from typing import TypeVar, Callable, List, Iterable, Iterator
+from os import getenv
+from models.storage import DATA, create_storage
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
-DATA = {}
+
+# Backend used by every model, selected by MODELS_STORAGE
+storage = create_storage()
+
+# Keep timestamps read from file as strings until they are first read
+LAZY_TIMESTAMPS = (getenv("DB_LAZY_TIMESTAMPS", "false").lower()
+                   in ("1", "true"))
+
+# Functions called with "save" or "remove" and the object after each
+# write of this process, for caches derived from the objects
+write_listeners = []
+
+
+@lru_cache(maxsize=65536)
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string; equal strings share one datetime
+    """
+    # Fixed-width "YYYY-MM-DDTHH:MM:SS" is parsed in C by fromisoformat
+    if len(value) == 19 and value[10] == 'T':
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def format_timestamp(value: datetime) -> str:
+    """ Format a datetime with TIMESTAMP_FORMAT
+    """
+    if value.tzinfo is None and value.year >= 1000:
+        return value.isoformat(timespec='seconds')
+    return value.strftime(TIMESTAMP_FORMAT)
 
 
 class Base():
     """ Base class
+
+    Subclasses list in `indexes` the attributes that `search` should
+    look up through an index (a hash index in memory, an indexed column
+    with SQLite) instead of scanning every object.
+
+    `aggregates` maps names to functions keying an object, such as its
+    creation day; the storage counts the objects per key as they are
+    saved and removed, so `aggregate` does not scan them.
+
+    The attributes of Base are slots. A subclass declaring `__slots__`
+    for its own attributes has no per-instance `__dict__`; one that
+    does not keeps the usual dict layout.
     """
+    __slots__ = ('id', '_created_at', '_updated_at')
+    # Public names of the slots backing properties
+    _slot_aliases = {'_created_at': 'created_at', '_updated_at': 'updated_at'}
+    indexes = ()
+    aggregates = {}
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
@@ -23,17 +72,50 @@ class Base():
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
 
-        self.id = kwargs.get('id', str(uuid.uuid4()))
-        if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+        # Only generate an id when none is given
+        self.id = kwargs['id'] if 'id' in kwargs else str(uuid.uuid4())
+        created_at = kwargs.get('created_at')
+        if created_at is not None:
+            if not LAZY_TIMESTAMPS:
+                created_at = parse_timestamp(created_at)
+            self._created_at = created_at
         else:
-            self.created_at = datetime.utcnow()
-        if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self._created_at = datetime.utcnow()
+        updated_at = kwargs.get('updated_at')
+        if updated_at is not None:
+            if not LAZY_TIMESTAMPS:
+                updated_at = parse_timestamp(updated_at)
+            self._updated_at = updated_at
         else:
-            self.updated_at = datetime.utcnow()
+            self._updated_at = datetime.utcnow()
+
+    @property
+    def created_at(self) -> datetime:
+        """ Creation date, parsed on first read when loaded lazily
+        """
+        if type(self._created_at) is str:
+            self._created_at = parse_timestamp(self._created_at)
+        return self._created_at
+
+    @created_at.setter
+    def created_at(self, value: datetime):
+        """ Setter of the creation date
+        """
+        self._created_at = value
+
+    @property
+    def updated_at(self) -> datetime:
+        """ Last update date, parsed on first read when loaded lazily
+        """
+        if type(self._updated_at) is str:
+            self._updated_at = parse_timestamp(self._updated_at)
+        return self._updated_at
+
+    @updated_at.setter
+    def updated_at(self, value: datetime):
+        """ Setter of the last update date
+        """
+        self._updated_at = value
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
@@ -44,69 +126,115 @@ class Base():
             return False
         return (self.id == other.id)
 
+    @classmethod
+    def _slot_names(cls) -> List[str]:
+        """ Names of the slots of the class, base classes first
+        """
+        names = cls.__dict__.get('_slot_names_cache')
+        if names is None:
+            names = []
+            for klass in reversed(cls.__mro__):
+                for name in klass.__dict__.get('__slots__', ()):
+                    if name not in ('__dict__', '__weakref__'):
+                        names.append(name)
+            cls._slot_names_cache = names
+        return names
+
+    def _attributes(self) -> Iterator:
+        """ Iterate over the (name, value) pairs set on the object, slots
+        first then the instance dict. Timestamps not parsed yet are
+        returned as their TIMESTAMP_FORMAT string
+        """
+        aliases = self._slot_aliases
+        for name in self._slot_names():
+            try:
+                yield aliases.get(name, name), getattr(self, name)
+            except AttributeError:
+                continue
+        if hasattr(self, '__dict__'):
+            yield from self.__dict__.items()
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
         result = {}
-        for key, value in self.__dict__.items():
+        for key, value in self._attributes():
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
+                result[key] = format_timestamp(value)
             else:
                 result[key] = value
         return result
 
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from the storage
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
-
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        storage.load(cls)
 
     @classmethod
     def save_to_file(cls):
-        """ Save all objects to file
+        """ Save all objects to the storage
+        """
+        storage.flush(cls)
+
+    @classmethod
+    def batch(cls):
+        """ Context manager deferring the writes of its block until it
+        exits, and dropping them if the block raises: the objects it
+        saved are then read as last persisted, while the instances held
+        by the caller keep their changes
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        return storage.batch()
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def bulk_save(cls, objs: Iterable[TypeVar('Base')]):
+        """ Save many objects, writing once
+        """
+        with cls.batch():
+            for obj in objs:
+                obj.save()
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        storage.save(self)
+        for listener in write_listeners:
+            listener("save", self)
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        storage.remove(self)
+        for listener in write_listeners:
+            listener("remove", self)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return storage.count(cls)
+
+    @classmethod
+    def aggregate(cls, name: str) -> dict:
+        """ Number of objects per key of an aggregate
+        """
+        return storage.aggregate(cls, name)
+
+    @classmethod
+    def removals(cls):
+        """ Token changing whenever an object of the class is removed,
+        by any process sharing the storage
+        """
+        return storage.removals(cls)
+
+    @classmethod
+    def register_aggregate(cls, name: str, func: Callable):
+        """ Add an aggregate counting the objects per `func(obj)`
+        """
+        cls.aggregates = {**cls.aggregates, name: func}
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -114,24 +242,31 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def iter(cls, offset: int = 0,
+             limit: int = None) -> Iterator[TypeVar('Base')]:
+        """ Iterate lazily over objects, skipping the first `offset`
+        ones and yielding at most `limit` of them
+        """
+        return storage.iter(cls, offset, limit)
+
+    @classmethod
+    def page(cls, after: str = None,
+             limit: int = None) -> List[TypeVar('Base')]:
+        """ Return at most `limit` objects with an ID greater than
+        `after`, in ID order: the ID of the last object of a page is
+        the cursor of the next one
+        """
+        return storage.page(cls, after, limit)
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return storage.get(cls, id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
-        s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        return storage.search(cls, attributes)
@@ -0,0 +1,1325 @@
+#!/usr/bin/env python3
+""" Storage module: backends persisting the models
+"""
+from abc import ABC, abstractmethod
+from bisect import bisect_right, insort
+from contextlib import contextmanager
+from itertools import islice
+from typing import TypeVar, List, Iterator, Tuple
+from os import getenv, path
+import fcntl
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+DATA = {}
+
+# Append mutations to a journal instead of rewriting the whole file
+USE_JOURNAL = getenv("DB_JOURNAL", "false").lower() in ("1", "true")
+# Journal size in bytes above which it is compacted into the snapshot
+JOURNAL_COMPACT_SIZE = int(getenv("DB_JOURNAL_COMPACT_SIZE", 1024 * 1024))
+_journal_lock = threading.RLock()
+# Seconds after which a rotated journal is taken as left by a dead process
+STALE_COMPACTION_SECONDS = 60
+
+# Secondary indexes: class name -> attribute -> value -> {id: object}
+INDEXES = {}
+# Indexed values of each object, to unindex them: class name -> id -> dict
+INDEXED_VALUES = {}
+# Aggregates: class name -> aggregate name -> key -> number of objects
+AGGREGATES = {}
+# Aggregate keys of each object, to discount them: class name -> id -> dict
+AGGREGATED_KEYS = {}
+# Removals of objects and reloads in this process: class name -> counter
+REMOVALS = {}
+# IDs in order for keyset pages: class name -> sorted list, which may
+# still hold removed IDs
+SORTED_IDS = {}
+
+# Characters read at once by the streaming loader
+READ_SIZE = 64 * 1024
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+# Start of a file holding one object of serialized objects keyed by id
+_keyed_format = re.compile(r'[ \t\n\r]*\{[ \t\n\r]*"(?:[^"\\]|\\.)*"'
+                           r'[ \t\n\r]*:[ \t\n\r]*\{')
+_empty_object = re.compile(r'[ \t\n\r]*\{[ \t\n\r]*\}')
+
+
+class _JSONStream():
+    """ Reader of consecutive JSON values from a text file, keeping only
+    the value being parsed in memory
+    """
+
+    def __init__(self, f):
+        """ Initialize the stream on an open file
+        """
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size: int = READ_SIZE) -> bool:
+        """ Drop the consumed text and read more, returns False at the
+        end of the file
+        """
+        if self.eof:
+            return False
+        chunk = self.f.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """ Next non-whitespace character, '' at the end of the file
+        """
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char: str):
+        """ Consume the next non-whitespace character, which must be `char`
+        """
+        if self.peek() != char:
+            raise ValueError(
+                "Expected '{}' at offset {}".format(char, self.pos))
+        self.pos += 1
+
+    def value(self):
+        """ Parse the next JSON value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # The value goes on past the buffer
+                if not self.fill():
+                    raise
+                continue
+            if end == len(self.buf) and self.fill():
+                # A number may be cut at the end of the buffer
+                continue
+            self.pos = end
+            return value
+
+
+def iter_file_objects(file_path: str) -> Iterator[Tuple[str, dict]]:
+    """ Stream the (id, serialized object) pairs of a model file, one at a
+    time. The file is either one JSON object mapping ids to serialized
+    objects, or one serialized object per line
+    """
+    with open(file_path, 'r') as f:
+        stream = _JSONStream(f)
+        stream.fill(1024)
+        if _empty_object.match(stream.buf):
+            return
+        if _keyed_format.match(stream.buf):
+            stream.expect('{')
+            while True:
+                obj_id = stream.value()
+                stream.expect(':')
+                yield obj_id, stream.value()
+                if stream.peek() == '}':
+                    return
+                stream.expect(',')
+        while stream.peek() != '':
+            obj_json = stream.value()
+            yield obj_json['id'], obj_json
+
+
+def matches(obj: TypeVar('Base'), attributes: dict) -> bool:
+    """ Tell whether an object has all the given attribute values
+    """
+    for k, v in attributes.items():
+        if (getattr(obj, k) != v):
+            return False
+    return True
+
+
+class Storage(ABC):
+    """ Interface of the storage backends used by Base
+    """
+
+    @abstractmethod
+    def load(self, cls: type):
+        """ Load all objects of a class
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def flush(self, cls: type):
+        """ Persist all objects of a class
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def save(self, obj: TypeVar('Base')):
+        """ Store an object
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete an object
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def search(self, cls: type, attributes: dict) -> List[TypeVar('Base')]:
+        """ Return the objects with matching attributes
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def count(self, cls: type) -> int:
+        """ Count the objects of a class
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def aggregate(self, cls: type, name: str) -> dict:
+        """ Number of objects of a class per key of an aggregate
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def iter(self, cls: type, offset: int,
+             limit: int) -> Iterator[TypeVar('Base')]:
+        """ Iterate lazily over `limit` objects from `offset`
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def page(self, cls: type, after: str,
+             limit: int) -> List[TypeVar('Base')]:
+        """ Return at most `limit` objects with an ID greater than
+        `after`, in ID order
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def removals(self, cls: type):
+        """ Token changing whenever an object of a class is removed, by
+        any process sharing the storage; saves leave it unchanged
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    @contextmanager
+    def batch(self):
+        """ Group the writes of the block, see Base.batch
+        """
+        raise NotImplementedError()
+
+
+class MemoryStorage(Storage):
+    """ Storage keeping the objects in DATA only, with hash indexes on
+    the `indexes` attributes of each class and counters of the
+    `aggregates` of each class, updated on every write
+    """
+
+    def __init__(self):
+        """ Initialize the storage
+        """
+        # Open batches of each thread
+        self._batch = threading.local()
+        # class name -> id -> serialized object as last persisted,
+        # restored by a rollback
+        self._records = {}
+
+    def load(self, cls: type):
+        """ Nothing to load: make sure the class has a store
+        """
+        DATA.setdefault(cls.__name__, {})
+        self.rebuild_indexes(cls)
+        self.flush(cls)
+
+    def flush(self, cls: type):
+        """ Nothing to persist: keep the serialized objects for rollbacks,
+        only those written by the batch when one commits
+        """
+        s_class = cls.__name__
+        writes = getattr(self._batch, "writes", None)
+        if writes is None:
+            self._records[s_class] = {
+                obj_id: obj.to_json(True)
+                for obj_id, obj in DATA[s_class].items()}
+            return
+        records = self._records.setdefault(s_class, {})
+        for obj_id, obj in writes.get(s_class, {}).items():
+            if obj is None:
+                records.pop(obj_id, None)
+            else:
+                records[obj_id] = obj.to_json(True)
+
+    def _persist(self, op: str, obj: TypeVar('Base')):
+        """ Persist one mutation, called out of batches
+        """
+        records = self._records.setdefault(obj.__class__.__name__, {})
+        if op == "save":
+            records[obj.id] = obj.to_json(True)
+        else:
+            records.pop(obj.id, None)
+
+    def rebuild_indexes(self, cls: type):
+        """ Index again every object of a class
+        """
+        s_class = cls.__name__
+        self._reset_indexes(cls)
+        SORTED_IDS.pop(s_class, None)
+        # Objects may be gone from the reloaded ones
+        self._removed(s_class)
+        for obj in DATA[s_class].values():
+            self._index(obj)
+
+    def _removed(self, s_class: str):
+        """ Count one more removal of an object of a class
+        """
+        REMOVALS[s_class] = REMOVALS.get(s_class, 0) + 1
+
+    def _reset_indexes(self, cls: type):
+        """ Empty the indexes and aggregates of a class
+        """
+        s_class = cls.__name__
+        INDEXES[s_class] = {attr: {} for attr in cls.indexes}
+        INDEXED_VALUES[s_class] = {}
+        AGGREGATES[s_class] = {name: {} for name in cls.aggregates}
+        AGGREGATED_KEYS[s_class] = {}
+
+    def _index(self, obj: TypeVar('Base')):
+        """ Add an object to the indexes and aggregates of its class
+        """
+        cls = obj.__class__
+        s_class = cls.__name__
+        ids = SORTED_IDS.get(s_class)
+        if ids is not None:
+            i = bisect_right(ids, obj.id)
+            if not i or ids[i - 1] != obj.id:
+                ids.insert(i, obj.id)
+        if not cls.indexes and not cls.aggregates:
+            return
+        if s_class not in INDEXES:
+            self._reset_indexes(cls)
+        self._unindex(obj)
+        values = {}
+        for attr in cls.indexes:
+            value = getattr(obj, attr, None)
+            try:
+                INDEXES[s_class][attr].setdefault(value, {})[obj.id] = obj
+            except TypeError:
+                # Unhashable values are only found by scanning
+                continue
+            values[attr] = value
+        INDEXED_VALUES[s_class][obj.id] = values
+        keys = {}
+        for name, func in cls.aggregates.items():
+            counts = AGGREGATES[s_class].get(name)
+            if counts is None:
+                # Registered after the objects were indexed: computed
+                # over all of them by the first aggregate call
+                continue
+            try:
+                key = func(obj)
+                counts[key] = counts.get(key, 0) + 1
+            except (AttributeError, TypeError, ValueError):
+                # Objects the aggregate cannot key are not counted
+                continue
+            keys[name] = key
+        AGGREGATED_KEYS[s_class][obj.id] = keys
+
+    def _unindex(self, obj: TypeVar('Base')):
+        """ Remove an object from the indexes and aggregates of its class
+        """
+        s_class = obj.__class__.__name__
+        values = INDEXED_VALUES.get(s_class, {}).pop(obj.id, None)
+        if values is not None:
+            for attr, value in values.items():
+                bucket = INDEXES[s_class][attr].get(value)
+                if bucket is not None:
+                    bucket.pop(obj.id, None)
+                    if not bucket:
+                        del INDEXES[s_class][attr][value]
+        keys = AGGREGATED_KEYS.get(s_class, {}).pop(obj.id, None)
+        if keys is not None:
+            for name, key in keys.items():
+                counts = AGGREGATES[s_class][name]
+                counts[key] -= 1
+                if not counts[key]:
+                    del counts[key]
+
+    @contextmanager
+    def batch(self):
+        """ Defer persistence of the block until it exits, then commit
+        each touched class once. If the block raises, the objects it
+        wrote are restored as last persisted and nothing is written
+        """
+        if getattr(self._batch, "classes", None) is not None:
+            # Nested batch: the outermost one commits
+            yield
+            return
+        # class name -> class written by the batch
+        self._batch.classes = {}
+        # class name -> id -> object saved, or None if removed
+        self._batch.writes = {}
+        try:
+            yield
+        except BaseException:
+            for s_class, klass in self._batch.classes.items():
+                self._rollback(klass, self._batch.writes[s_class])
+            raise
+        else:
+            for klass in self._batch.classes.values():
+                self.flush(klass)
+        finally:
+            self._batch.classes = None
+            self._batch.writes = None
+
+    def _rollback(self, cls: type, writes: dict):
+        """ Restore the objects of a class written by a batch from their
+        records: the stored instances may have been changed in place
+        before they were saved
+        """
+        s_class = cls.__name__
+        records = self._records.get(s_class, {})
+        for obj_id in writes:
+            record = records.get(obj_id)
+            if record is None:
+                DATA[s_class].pop(obj_id, None)
+            else:
+                DATA[s_class][obj_id] = cls(**record)
+        self.rebuild_indexes(cls)
+
+    def _before_write(self, op: str, obj: TypeVar('Base')) -> bool:
+        """ Record the write if a batch is open, returns True when
+        persistence has to be deferred
+        """
+        classes = getattr(self._batch, "classes", None)
+        if classes is None:
+            return False
+        s_class = obj.__class__.__name__
+        if s_class not in classes:
+            classes[s_class] = obj.__class__
+            self._batch.writes[s_class] = {}
+        self._batch.writes[s_class][obj.id] = obj if op == "save" else None
+        return True
+
+    def save(self, obj: TypeVar('Base')):
+        """ Store an object
+        """
+        s_class = obj.__class__.__name__
+        deferred = self._before_write("save", obj)
+        DATA[s_class][obj.id] = obj
+        self._index(obj)
+        if not deferred:
+            self._persist("save", obj)
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete an object
+        """
+        s_class = obj.__class__.__name__
+        if DATA[s_class].get(obj.id) is not None:
+            deferred = self._before_write("remove", obj)
+            del DATA[s_class][obj.id]
+            self._unindex(obj)
+            self._removed(s_class)
+            if not deferred:
+                self._persist("remove", obj)
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        return DATA[cls.__name__].get(id)
+
+    def search(self, cls: type, attributes: dict) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes, through an
+        index when one covers an attribute of the query
+        """
+        s_class = cls.__name__
+        objs = DATA[s_class].values()
+        for k, v in attributes.items():
+            if k in INDEXES.get(s_class, {}):
+                try:
+                    objs = INDEXES[s_class][k].get(v, {}).values()
+                except TypeError:
+                    continue
+                break
+        return [obj for obj in objs if matches(obj, attributes)]
+
+    def count(self, cls: type) -> int:
+        """ Count all objects
+        """
+        return len(DATA[cls.__name__])
+
+    def aggregate(self, cls: type, name: str) -> dict:
+        """ Counts of an aggregate, kept up to date on every write; an
+        aggregate registered after the objects were loaded is computed
+        on first use
+        """
+        if name not in cls.aggregates:
+            raise KeyError(name)
+        s_class = cls.__name__
+        if name not in AGGREGATES.get(s_class, {}):
+            self.rebuild_indexes(cls)
+        return dict(AGGREGATES[s_class][name])
+
+    def iter(self, cls: type, offset: int,
+             limit: int) -> Iterator[TypeVar('Base')]:
+        """ Iterate lazily over objects, in insertion order
+        """
+        stop = None if limit is None else offset + limit
+        return islice(DATA[cls.__name__].values(), offset, stop)
+
+    def page(self, cls: type, after: str,
+             limit: int) -> List[TypeVar('Base')]:
+        """ Return at most `limit` objects with an ID greater than
+        `after`, in ID order, by bisecting the sorted IDs of the class
+        """
+        s_class = cls.__name__
+        objs = DATA[s_class]
+        ids = SORTED_IDS.get(s_class)
+        if ids is None or len(ids) > 2 * len(objs) + 1024:
+            # Built on first use, and again once removed IDs pile up
+            ids = SORTED_IDS[s_class] = sorted(objs)
+        i = 0 if after is None else bisect_right(ids, after)
+        result = []
+        while i < len(ids) and (limit is None or len(result) < limit):
+            obj = objs.get(ids[i])
+            if obj is not None:
+                result.append(obj)
+            i += 1
+        return result
+
+    def removals(self, cls: type) -> int:
+        """ Number of removals of objects of a class from DATA, reloads
+        included
+        """
+        return REMOVALS.get(cls.__name__, 0)
+
+
+class JSONFileStorage(MemoryStorage):
+    """ Storage of each class in a `.db_<class>.json` file, either
+    rewritten on every write or, with DB_JOURNAL, completed by an
+    append-only journal
+    """
+
+    def __init__(self, use_journal: bool = USE_JOURNAL):
+        """ Initialize the storage
+        """
+        super().__init__()
+        self.use_journal = use_journal
+        # class name -> journal rotations and flushes in this process
+        self._generations = {}
+        # class name -> generation whose rotated journal is compacting
+        self._compacting = {}
+
+    def load(self, cls: type):
+        """ Load all objects from file, then replay the journal; a
+        rotated journal left by a process that exited while compacting
+        it is folded into the snapshot
+        """
+        self._read(cls)
+        with _journal_lock:
+            old_path = ".db_{}.journal.old".format(cls.__name__)
+            if (path.exists(old_path) and
+                    cls.__name__ not in self._compacting):
+                self.flush(cls)
+
+    def _read(self, cls: type):
+        """ Load all objects from file, then replay the journals
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        DATA[s_class] = {}
+        if path.exists(file_path):
+            for obj_id, obj_json in iter_file_objects(file_path):
+                DATA[s_class][obj_id] = cls(**obj_json)
+
+        journal_path = ".db_{}.journal".format(s_class)
+        for j_path in (journal_path + ".old", journal_path):
+            if path.exists(j_path):
+                self._replay_journal(cls, j_path)
+        self.rebuild_indexes(cls)
+
+    def _rollback(self, cls: type, writes: dict):
+        """ Read the files again, which a batch only writes as it
+        commits; locked so that no compaction replaces them meanwhile
+        """
+        with _journal_lock:
+            self._read(cls)
+
+    def _persist(self, op: str, obj: TypeVar('Base')):
+        """ Append the mutation to the journal or rewrite the file
+        """
+        if self.use_journal:
+            self.append_to_journal(op, obj)
+        else:
+            self.flush(obj.__class__)
+
+    def _replay_journal(self, cls: type, journal_path: str,
+                        offset: int = 0, reindex: bool = False) -> int:
+        """ Apply the mutations recorded in a journal file from a byte
+        offset, returns the offset after the last complete record
+        """
+        s_class = cls.__name__
+        with open(journal_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Torn write of the last record
+                    break
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                old = DATA[s_class].pop(entry["id"], None)
+                if reindex and old is not None:
+                    self._unindex(old)
+                    if entry["op"] == "remove":
+                        self._removed(s_class)
+                if entry["op"] == "save":
+                    obj = cls(**entry["obj"])
+                    DATA[s_class][obj.id] = obj
+                    if reindex:
+                        self._index(obj)
+        return offset
+
+    def _dump_snapshot(self, cls: type, objs: dict) -> str:
+        """ Write the given objects to a temporary file, returns its path
+        """
+        file_path = ".db_{}.json".format(cls.__name__)
+        objs_json = {}
+        for obj_id, obj in objs.items():
+            objs_json[obj_id] = obj.to_json(True)
+
+        tmp_path = "{}.tmp.{}.{}".format(file_path, os.getpid(),
+                                         threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump(objs_json, f)
+        return tmp_path
+
+    def flush(self, cls: type):
+        """ Save all objects to file
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        journal_path = ".db_{}.journal".format(s_class)
+        with _journal_lock:
+            os.replace(self._dump_snapshot(cls, DATA[s_class]), file_path)
+            for j_path in (journal_path + ".old", journal_path):
+                if path.exists(j_path):
+                    os.remove(j_path)
+            self._generations[s_class] = self._generations.get(s_class,
+                                                               0) + 1
+
+    def append_to_journal(self, op: str, obj: TypeVar('Base')):
+        """ Append one mutation to the journal, compacting it in the
+        background once it is too big
+        """
+        cls = obj.__class__
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        entry = {"op": op, "id": obj.id}
+        if op == "save":
+            entry["obj"] = obj.to_json(True)
+        line = json.dumps(entry) + "\n"
+        with _journal_lock:
+            with open(journal_path, 'a') as f:
+                f.write(line)
+                size = f.tell()
+            old_path = journal_path + ".old"
+            if size < JOURNAL_COMPACT_SIZE:
+                return
+            if path.exists(old_path):
+                if s_class not in self._compacting:
+                    # Left by a process that exited while compacting it
+                    self.flush(cls)
+                return
+            # New mutations go to a fresh journal while the rotated one
+            # is folded into the snapshot
+            os.replace(journal_path, old_path)
+            generation = self._generations.get(s_class, 0) + 1
+            self._generations[s_class] = generation
+            self._compacting[s_class] = generation
+            objs = dict(DATA[s_class])
+        # Not a daemon: the interpreter waits for it before exiting
+        threading.Thread(target=self._compact,
+                         args=(cls, objs, old_path, generation)).start()
+
+    def _compact(self, cls: type, objs: dict, old_path: str,
+                 generation: int):
+        """ Write the snapshot and drop the rotated journal, unless a
+        flush or another rotation happened since `generation`
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        try:
+            tmp_path = self._dump_snapshot(cls, objs)
+            with _journal_lock:
+                if (self._generations.get(s_class) == generation and
+                        path.exists(old_path)):
+                    os.replace(tmp_path, file_path)
+                    os.remove(old_path)
+                else:
+                    # A full flush already superseded this snapshot
+                    os.remove(tmp_path)
+        finally:
+            with _journal_lock:
+                if self._compacting.get(s_class) == generation:
+                    del self._compacting[s_class]
+
+
+class SharedJSONFileStorage(JSONFileStorage):
+    """ Journaled JSON file storage shared by several processes, such as
+    gunicorn workers. Writes hold an exclusive lock on `.db_<class>.lock`;
+    before every operation the process replays only the journal records
+    written by the others since its last sync. `.db_<class>.gen` counts
+    the journal rotations, so a process knows when to read the rotated
+    journal or, if it was already compacted, to reload the whole file
+    """
+
+    def __init__(self):
+        """ Initialize the storage
+        """
+        super().__init__(use_journal=True)
+        # class name -> [generation, journal offset, files stamp]
+        self._state = {}
+        self._reset_locks()
+        # An inherited lock file would be shared with the parent process
+        os.register_at_fork(after_in_child=self._reset_locks)
+
+    def _reset_locks(self):
+        """ Forget the lock files, opened again on first use
+        """
+        self._lock = threading.RLock()
+        self._lock_files = {}
+        self._lock_depth = {}
+
+    @contextmanager
+    def _locked(self, cls: type, exclusive: bool):
+        """ Hold the file lock of a class, shared or exclusive
+        """
+        s_class = cls.__name__
+        with self._lock:
+            if self._lock_depth.get(s_class):
+                # Already held by this thread
+                self._lock_depth[s_class] += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth[s_class] -= 1
+                return
+            f = self._lock_files.get(s_class)
+            if f is None:
+                f = open(".db_{}.lock".format(s_class), 'a')
+                self._lock_files[s_class] = f
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._lock_depth[s_class] = 1
+            try:
+                yield
+            finally:
+                self._lock_depth[s_class] = 0
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _generation(s_class: str) -> int:
+        """ Number of journal rotations of a class
+        """
+        try:
+            with open(".db_{}.gen".format(s_class), 'r') as f:
+                return int(f.read() or 0)
+        except OSError:
+            return 0
+
+    def _next_generation(self, s_class: str) -> int:
+        """ Count one more rotation, returns the new generation
+        """
+        gen_path = ".db_{}.gen".format(s_class)
+        generation = self._generation(s_class) + 1
+        tmp_path = "{}.tmp.{}".format(gen_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write(str(generation))
+        os.replace(tmp_path, gen_path)
+        return generation
+
+    @staticmethod
+    def _stamp(s_class: str) -> tuple:
+        """ Fingerprint of the journal and generation files
+        """
+        stamp = ()
+        for file_path in (".db_{}.journal".format(s_class),
+                          ".db_{}.gen".format(s_class)):
+            try:
+                st = os.stat(file_path)
+                stamp += (st.st_ino, st.st_size, st.st_mtime_ns)
+            except OSError:
+                stamp += (None,)
+        return stamp
+
+    def _journal_size(self, s_class: str) -> int:
+        """ Size of the journal of a class, 0 if there is none
+        """
+        try:
+            return os.path.getsize(".db_{}.journal".format(s_class))
+        except OSError:
+            return 0
+
+    def load(self, cls: type):
+        """ Load all objects from file, then replay the journal
+        """
+        s_class = cls.__name__
+        with self._locked(cls, False):
+            self._read(cls)
+            self._state[s_class] = [self._generation(s_class),
+                                    self._journal_size(s_class),
+                                    self._stamp(s_class)]
+
+    def _catch_up(self, cls: type):
+        """ Apply the records written by other processes, lock held;
+        the pending writes of a batch of this thread stay on top of
+        them, and so are in the snapshot when the batch commits
+        """
+        self._read_records(cls)
+        writes = getattr(self._batch, "writes", None)
+        if writes:
+            for obj_id, obj in writes.get(cls.__name__, {}).items():
+                self._apply(cls, obj_id, obj)
+
+    def _read_records(self, cls: type):
+        """ Apply the records written since the last sync, lock held
+        """
+        s_class = cls.__name__
+        if s_class not in self._state:
+            self.load(cls)
+            return
+        generation, offset, _ = self._state[s_class]
+        journal_path = ".db_{}.journal".format(s_class)
+        old_path = journal_path + ".old"
+        current = self._generation(s_class)
+        if current == generation + 1 and path.exists(old_path):
+            self._replay_journal(cls, old_path, offset, True)
+            offset = 0
+        elif current != generation:
+            self.load(cls)
+            return
+        if path.exists(journal_path):
+            offset = self._replay_journal(cls, journal_path, offset, True)
+        self._state[s_class] = [current, offset, self._stamp(s_class)]
+
+    def _apply(self, cls: type, obj_id: str, obj: TypeVar('Base')):
+        """ Store an object over the one with its ID, or remove it if
+        `obj` is None, keeping the indexes up to date
+        """
+        s_class = cls.__name__
+        old = DATA[s_class].pop(obj_id, None)
+        if old is not None:
+            self._unindex(old)
+            if obj is None:
+                self._removed(s_class)
+        if obj is not None:
+            DATA[s_class][obj_id] = obj
+            self._index(obj)
+
+    def sync(self, cls: type):
+        """ Bring the objects of a class up to date with the files
+        """
+        s_class = cls.__name__
+        state = self._state.get(s_class)
+        if state is not None and state[2] == self._stamp(s_class):
+            return
+        with self._locked(cls, False):
+            self._catch_up(cls)
+
+    def append_to_journal(self, op: str, obj: TypeVar('Base')):
+        """ Append one mutation to the shared journal, compacting it in
+        the background once it is too big
+        """
+        cls = obj.__class__
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        entry = {"op": op, "id": obj.id}
+        if op == "save":
+            entry["obj"] = obj.to_json(True)
+        line = json.dumps(entry) + "\n"
+        objs = None
+        with self._locked(cls, True):
+            self._catch_up(cls)
+            # Records of other processes must not hide this write
+            self._apply(cls, obj.id, obj if op == "save" else None)
+            with open(journal_path, 'a') as f:
+                f.write(line)
+                size = f.tell()
+            generation = self._state[s_class][0]
+            old_path = journal_path + ".old"
+            if size >= JOURNAL_COMPACT_SIZE and not path.exists(old_path):
+                os.replace(journal_path, old_path)
+                generation = self._next_generation(s_class)
+                size = 0
+                objs = dict(DATA[s_class])
+            elif size >= JOURNAL_COMPACT_SIZE and (
+                    time.time() - path.getmtime(old_path) >
+                    STALE_COMPACTION_SECONDS):
+                # The process compacting it died: fold everything now
+                self.flush(cls)
+                return
+            self._state[s_class] = [generation, size, self._stamp(s_class)]
+        if objs is not None:
+            threading.Thread(target=self._compact,
+                             args=(cls, objs, old_path, generation)).start()
+
+    def _compact(self, cls: type, objs: dict, old_path: str,
+                 generation: int):
+        """ Write the snapshot and drop the rotated journal, unless a
+        flush or another rotation happened since `generation`: the
+        rotated journal, if any, is then a newer one
+        """
+        file_path = ".db_{}.json".format(cls.__name__)
+        tmp_path = self._dump_snapshot(cls, objs)
+        with self._locked(cls, True):
+            if (self._generation(cls.__name__) == generation and
+                    path.exists(old_path)):
+                os.replace(tmp_path, file_path)
+                os.remove(old_path)
+            else:
+                os.remove(tmp_path)
+
+    def flush(self, cls: type):
+        """ Save all objects to file and start a new journal generation,
+        after applying the records of other processes: the snapshot
+        replaces the journal, which must not lose them
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        journal_path = ".db_{}.journal".format(s_class)
+        with self._locked(cls, True):
+            self._catch_up(cls)
+            os.replace(self._dump_snapshot(cls, DATA[s_class]), file_path)
+            for j_path in (journal_path + ".old", journal_path):
+                if path.exists(j_path):
+                    os.remove(j_path)
+            generation = self._next_generation(s_class)
+            self._state[s_class] = [generation, 0, self._stamp(s_class)]
+
+    def _rollback(self, cls: type, writes: dict):
+        """ Read the files again: records of other processes applied
+        during the batch are in them, and the journal offset is already
+        past them
+        """
+        self.load(cls)
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        self.sync(cls)
+        return super().get(cls, id)
+
+    def search(self, cls: type, attributes: dict) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes
+        """
+        self.sync(cls)
+        return super().search(cls, attributes)
+
+    def count(self, cls: type) -> int:
+        """ Count all objects
+        """
+        self.sync(cls)
+        return super().count(cls)
+
+    def aggregate(self, cls: type, name: str) -> dict:
+        """ Counts of an aggregate
+        """
+        self.sync(cls)
+        return super().aggregate(cls, name)
+
+    def iter(self, cls: type, offset: int,
+             limit: int) -> Iterator[TypeVar('Base')]:
+        """ Iterate lazily over objects, in insertion order
+        """
+        self.sync(cls)
+        return super().iter(cls, offset, limit)
+
+    def page(self, cls: type, after: str,
+             limit: int) -> List[TypeVar('Base')]:
+        """ Return at most `limit` objects with an ID greater than
+        `after`, in ID order
+        """
+        self.sync(cls)
+        return super().page(cls, after, limit)
+
+    def removals(self, cls: type) -> int:
+        """ Number of removals of objects of a class, those of other
+        processes included once synced
+        """
+        self.sync(cls)
+        return super().removals(cls)
+
+
+class SQLiteStorage(Storage):
+    """ Storage of each class in an SQLite table holding the serialized
+    objects, with an indexed column per `indexes` attribute.
+
+    The counts of each aggregate are kept in the `<class>__counts`
+    table, computed by the first `aggregate` call and then updated by
+    every write along with the aggregate keys of the object, stored in
+    its `_aggregates` column; `<class>__aggregates` lists the aggregates
+    computed so far
+    """
+
+    def __init__(self, db_path: str):
+        """ Initialize the storage on a database file
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._tables = set()
+        self._tables_lock = threading.Lock()
+        # class name -> names of the aggregates known to be computed
+        self._computed = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Connection of the current thread
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    def _table(self, cls: type) -> str:
+        """ Create the table of a class if needed, returns its name
+        """
+        s_class = cls.__name__
+        if s_class not in self._tables:
+            with self._tables_lock:
+                columns = "".join(', "{}"'.format(attr)
+                                  for attr in cls.indexes)
+                conn = self._connection()
+                conn.execute('CREATE TABLE IF NOT EXISTS "{}" ('
+                             'id TEXT PRIMARY KEY, data TEXT NOT NULL, '
+                             '_aggregates TEXT{})'.format(s_class, columns))
+                existing = {row[1] for row in conn.execute(
+                    'PRAGMA table_info("{}")'.format(s_class))}
+                if "_aggregates" not in existing:
+                    # Table created before the aggregate counters
+                    conn.execute('ALTER TABLE "{}" ADD COLUMN _aggregates '
+                                 'TEXT'.format(s_class))
+                for attr in cls.indexes:
+                    conn.execute('CREATE INDEX IF NOT EXISTS "{0}_{1}" '
+                                 'ON "{0}" ("{1}")'.format(s_class, attr))
+                conn.execute('CREATE TABLE IF NOT EXISTS "{}__counts" ('
+                             'name TEXT NOT NULL, key TEXT NOT NULL, '
+                             'count INTEGER NOT NULL, '
+                             'PRIMARY KEY (name, key))'.format(s_class))
+                conn.execute('CREATE TABLE IF NOT EXISTS "{}__aggregates" ('
+                             'name TEXT PRIMARY KEY)'.format(s_class))
+                conn.execute('CREATE TABLE IF NOT EXISTS "__removals" ('
+                             'name TEXT PRIMARY KEY, '
+                             'count INTEGER NOT NULL)')
+                self._tables.add(s_class)
+        return s_class
+
+    def _build(self, cls: type, data: str) -> TypeVar('Base'):
+        """ Build an object from its serialized JSON
+        """
+        return cls(**json.loads(data))
+
+    def load(self, cls: type):
+        """ Objects are read on demand: make sure the table exists
+        """
+        self._table(cls)
+
+    def flush(self, cls: type):
+        """ Every write is already persisted
+        """
+        pass
+
+    def _computed_aggregates(self, cls: type) -> dict:
+        """ Functions of the aggregates of a class whose counts are
+        computed, in a transaction
+        """
+        s_class = cls.__name__
+        computed = self._computed.setdefault(s_class, set())
+        if not computed.issuperset(cls.aggregates):
+            # Another process may have computed them since
+            names = {name for name, in self._connection().execute(
+                'SELECT name FROM "{}__aggregates"'.format(s_class))}
+            if self._local.depth <= 1:
+                # Not written by an enclosing batch, which could roll back
+                computed.update(names)
+            computed = computed | names
+        return {name: func for name, func in cls.aggregates.items()
+                if name in computed}
+
+    @staticmethod
+    def _aggregate_keys(obj: TypeVar('Base'), funcs: dict) -> dict:
+        """ Keys of an object for the given aggregates, JSON encoded;
+        objects an aggregate cannot key are not counted
+        """
+        keys = {}
+        for name, func in funcs.items():
+            try:
+                key = func(obj)
+                hash(key)
+                keys[name] = json.dumps(key)
+            except (AttributeError, TypeError, ValueError):
+                continue
+        return keys
+
+    def _count(self, cls: type, keys: dict, delta: int):
+        """ Add `delta` to the counts of the given keys, in a transaction
+        """
+        conn = self._connection()
+        for name, key in keys.items():
+            conn.execute(
+                'INSERT INTO "{0}__counts" (name, key, count) '
+                'VALUES (?, ?, ?) ON CONFLICT (name, key) '
+                'DO UPDATE SET count = count + excluded.count'.format(
+                    cls.__name__), (name, key, delta))
+        if delta < 0:
+            conn.execute('DELETE FROM "{}__counts" WHERE count <= 0'.format(
+                cls.__name__))
+
+    def _stored_keys(self, cls: type, id: str) -> dict:
+        """ Aggregate keys stored with an object, None if it does not
+        exist
+        """
+        row = self._connection().execute(
+            'SELECT _aggregates FROM "{}" WHERE id = ?'.format(cls.__name__),
+            (id,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]) if row[0] else {}
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or replace an object, updating the aggregate counts
+        in the same transaction
+        """
+        cls = obj.__class__
+        self._table(cls)
+        with self.batch():
+            if not cls.aggregates:
+                self._write(obj, None)
+                return
+            funcs = self._computed_aggregates(cls)
+            old_keys = self._stored_keys(cls, obj.id)
+            keys = self._aggregate_keys(obj, funcs)
+            if old_keys:
+                self._count(cls, old_keys, -1)
+            self._count(cls, keys, 1)
+            self._write(obj, json.dumps(keys))
+
+    def _removed(self, cls: type):
+        """ Count one more removal of an object of a class, in a
+        transaction
+        """
+        self._connection().execute(
+            'INSERT INTO "__removals" (name, count) VALUES (?, 1) '
+            'ON CONFLICT (name) DO UPDATE SET count = count + 1',
+            (cls.__name__,))
+
+    def _write(self, obj: TypeVar('Base'), keys: str):
+        """ Insert or replace the row of an object
+        """
+        cls = obj.__class__
+        columns = ["id", "data", "_aggregates"]
+        columns += ['"{}"'.format(a) for a in cls.indexes]
+        values = [obj.id, json.dumps(obj.to_json(True)), keys]
+        values += [getattr(obj, attr, None) for attr in cls.indexes]
+        self._connection().execute(
+            'INSERT OR REPLACE INTO "{}" ({}) VALUES ({})'.format(
+                cls.__name__, ", ".join(columns),
+                ", ".join("?" * len(values))), values)
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete an object, discounting its aggregate keys
+        """
+        cls = obj.__class__
+        table = self._table(cls)
+        with self.batch():
+            self._removed(cls)
+            if cls.aggregates:
+                old_keys = self._stored_keys(cls, obj.id)
+                if old_keys:
+                    self._count(cls, old_keys, -1)
+            self._connection().execute(
+                'DELETE FROM "{}" WHERE id = ?'.format(table), (obj.id,))
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        table = self._table(cls)
+        row = self._connection().execute(
+            'SELECT data FROM "{}" WHERE id = ?'.format(table),
+            (id,)).fetchone()
+        return None if row is None else self._build(cls, row[0])
+
+    def search(self, cls: type, attributes: dict) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes; indexed
+        attributes are filtered in SQL, the others in Python
+        """
+        table = self._table(cls)
+        clauses = []
+        params = []
+        rest = {}
+        for k, v in attributes.items():
+            if k in cls.indexes and v is None:
+                clauses.append('"{}" IS NULL'.format(k))
+            elif k in cls.indexes and isinstance(v, (str, int, float)):
+                clauses.append('"{}" = ?'.format(k))
+                params.append(v)
+            else:
+                rest[k] = v
+        query = 'SELECT data FROM "{}"'.format(table)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY rowid"
+        objs = (self._build(cls, data) for data,
+                in self._connection().execute(query, params))
+        return [obj for obj in objs if matches(obj, rest)]
+
+    def count(self, cls: type) -> int:
+        """ Count all objects
+        """
+        table = self._table(cls)
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM "{}"'.format(table)).fetchone()[0]
+
+    def aggregate(self, cls: type, name: str) -> dict:
+        """ Counts of an aggregate, read from the counts table; they are
+        computed by reading every object on first use, the aggregates
+        being Python functions SQLite cannot evaluate
+        """
+        if name not in cls.aggregates:
+            raise KeyError(name)
+        table = self._table(cls)
+        conn = self._connection()
+        if name not in self._computed.get(table, ()):
+            with self.batch():
+                if name not in self._computed_aggregates(cls):
+                    self._compute_aggregate(cls, name)
+            if not self._local.depth:
+                # Committed: an enclosing batch could still roll it back
+                self._computed[table].add(name)
+        return {json.loads(key): count for key, count in conn.execute(
+            'SELECT key, count FROM "{}__counts" WHERE name = ?'.format(
+                table), (name,))}
+
+    def _compute_aggregate(self, cls: type, name: str):
+        """ Count every object for an aggregate and store its key with
+        each of them, in a transaction
+        """
+        table = cls.__name__
+        conn = self._connection()
+        funcs = {name: cls.aggregates[name]}
+        counts = {}
+        rows = conn.execute('SELECT id, data, _aggregates FROM "{}"'.format(
+            table)).fetchall()
+        for id, data, stored in rows:
+            keys = json.loads(stored) if stored else {}
+            keys.pop(name, None)
+            keys.update(self._aggregate_keys(self._build(cls, data), funcs))
+            if name in keys:
+                counts[keys[name]] = counts.get(keys[name], 0) + 1
+            conn.execute('UPDATE "{}" SET _aggregates = ? WHERE id = ?'
+                         .format(table), (json.dumps(keys), id))
+        conn.execute('DELETE FROM "{}__counts" WHERE name = ?'.format(table),
+                     (name,))
+        conn.executemany(
+            'INSERT INTO "{}__counts" (name, key, count) VALUES (?, ?, ?)'
+            .format(table), [(name, key, count)
+                             for key, count in counts.items()])
+        conn.execute('INSERT INTO "{}__aggregates" (name) VALUES (?)'.format(
+            table), (name,))
+
+    def iter(self, cls: type, offset: int,
+             limit: int) -> Iterator[TypeVar('Base')]:
+        """ Iterate lazily over objects, in insertion order
+        """
+        table = self._table(cls)
+        cursor = self._connection().execute(
+            'SELECT data FROM "{}" ORDER BY rowid LIMIT ? OFFSET ?'.format(
+                table), (-1 if limit is None else limit, offset))
+        return (self._build(cls, data) for data, in cursor)
+
+    def page(self, cls: type, after: str,
+             limit: int) -> List[TypeVar('Base')]:
+        """ Return at most `limit` objects with an ID greater than
+        `after`, in ID order, through the primary key index
+        """
+        table = self._table(cls)
+        cursor = self._connection().execute(
+            'SELECT data FROM "{}" WHERE id > ? ORDER BY id LIMIT ?'.format(
+                table), ("" if after is None else after,
+                         -1 if limit is None else limit))
+        return [self._build(cls, data) for data, in cursor]
+
+    def removals(self, cls: type) -> int:
+        """ Number of removals of objects of a class, in any process
+        """
+        self._table(cls)
+        row = self._connection().execute(
+            'SELECT count FROM "__removals" WHERE name = ?',
+            (cls.__name__,)).fetchone()
+        return 0 if row is None else row[0]
+
+    @contextmanager
+    def batch(self):
+        """ Run the block in one transaction, rolled back if it raises
+        """
+        conn = self._connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+            return
+        # Take the write lock at once: a transaction reading before it
+        # writes could not upgrade its lock while another one writes
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+
+
+def create_storage(name: str = None) -> Storage:
+    """ Build the storage selected by name, or by the MODELS_STORAGE
+    environment variable: "json" (default), "json_shared" for several
+    worker processes, "memory" or "sqlite"
+    """
+    if name is None:
+        name = getenv("MODELS_STORAGE", "json")
+    if name == "json":
+        return JSONFileStorage()
+    if name == "json_shared":
+        return SharedJSONFileStorage()
+    if name == "memory":
+        return MemoryStorage()
+    if name == "sqlite":
+        return SQLiteStorage(getenv("MODELS_SQLITE_PATH", ".db.sqlite3"))
+    raise ValueError("Unknown storage: {}".format(name))
@@ -5,9 +5,31 @@ import hashlib
 from models.base import Base
 
 
+def creation_day(user: Base) -> str:
+    """ Day a user was created, as YYYY-MM-DD
+    """
+    created_at = user._created_at
+    if type(created_at) is str:
+        # Not parsed yet, see LAZY_TIMESTAMPS
+        return created_at[:10]
+    return created_at.date().isoformat()
+
+
+def has_name(user: Base) -> bool:
+    """ Whether a user has a first or last name
+    """
+    return user.first_name is not None or user.last_name is not None
+
+
 class User(Base):
     """ User class
     """
+    __slots__ = ('email', '_password', 'first_name', 'last_name')
+    indexes = ("email",)
+    aggregates = {
+        "by_creation_day": creation_day,
+        "with_name": has_name,
+    }
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
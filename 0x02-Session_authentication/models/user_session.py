@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+""" UserSession module
+"""
+from models.base import Base
+
+
+class UserSession(Base):
+    """ UserSession class: a session of SessionDBAuth
+    """
+    __slots__ = ('user_id', 'session_id')
+    indexes = ("session_id", "user_id")
+
+    def __init__(self, *args: list, **kwargs: dict):
+        """ Initialize a UserSession instance
+        """
+        super().__init__(*args, **kwargs)
+        self.user_id = kwargs.get('user_id')
+        self.session_id = kwargs.get('session_id')
@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+""" Test configuration: import the project modules from the parent
+directory
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
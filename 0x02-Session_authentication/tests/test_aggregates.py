@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+""" Tests of the aggregate counters of every storage backend
+"""
+import pytest
+import models.base
+import models.storage
+from models.storage import SQLiteStorage, create_storage
+from models.user import User
+
+
+@pytest.fixture(params=["memory", "json", "json_shared", "sqlite"])
+def storage(request, tmp_path, monkeypatch):
+    """ Empty storage of each kind in a temporary directory
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delitem(models.storage.DATA, "User", raising=False)
+    # Aggregates registered by a test are dropped after it
+    monkeypatch.setattr(User, "aggregates", dict(User.aggregates))
+    if request.param == "sqlite":
+        storage = SQLiteStorage(str(tmp_path / "db.sqlite3"))
+    else:
+        storage = create_storage(request.param)
+    monkeypatch.setattr(models.base, "storage", storage)
+    User.load_from_file()
+    return storage
+
+
+def save_users(count: int, start: int = 0) -> list:
+    """ Save `count` users, every other one with a first name
+    """
+    users = []
+    for i in range(start, start + count):
+        user = User(created_at="2024-05-{:02d}T12:00:00".format(i % 3 + 1))
+        user.email = "user{}@hbtn.io".format(i)
+        if i % 2:
+            user.first_name = "First"
+        user.save()
+        users.append(user)
+    return users
+
+
+def scanned(name: str) -> dict:
+    """ Counts of an aggregate computed over every user
+    """
+    counts = {}
+    for user in User.all():
+        try:
+            key = User.aggregates[name](user)
+        except (AttributeError, TypeError, ValueError):
+            continue
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def test_counts_follow_writes(storage):
+    """ Counts stay equal to a scan through saves, updates and removals
+    """
+    users = save_users(10)
+    assert User.aggregate("with_name") == scanned("with_name")
+    assert User.aggregate("by_creation_day") == scanned("by_creation_day")
+
+    users += save_users(5, 10)
+    users[0].first_name = "Now named"
+    users[0].save()
+    users[1].remove()
+    users[2].remove()
+    for name in User.aggregates:
+        assert User.aggregate(name) == scanned(name)
+    assert User.aggregate("with_name")[True] == 7
+
+
+def test_late_registered_aggregate(storage):
+    """ An aggregate registered after objects were saved counts them
+    all, and then every later write
+    """
+    save_users(10)
+    User.register_aggregate("short_email", lambda u: len(u.email) < 14)
+    save_users(1, 10)
+    assert User.aggregate("short_email") == {True: 10, False: 1}
+    save_users(2, 11)
+    assert User.aggregate("short_email") == scanned("short_email")
+
+
+def test_rolled_back_batch_is_not_counted(storage):
+    """ Writes of a rolled back batch leave the counts unchanged
+    """
+    users = save_users(4)
+    before = User.aggregate("with_name")
+    with pytest.raises(RuntimeError):
+        with User.batch():
+            save_users(3, 4)
+            users[0].remove()
+            raise RuntimeError("rolled back")
+    assert User.aggregate("with_name") == before == scanned("with_name")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+""" Tests of the batches of every storage backend
+"""
+import pytest
+import models.base
+import models.storage
+from models.storage import SQLiteStorage, create_storage
+from models.user import User
+
+
+@pytest.fixture(params=["memory", "json", "json_journal", "json_shared",
+                        "sqlite"])
+def storage(request, tmp_path, monkeypatch):
+    """ Empty storage of each kind in a temporary directory
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delitem(models.storage.DATA, "User", raising=False)
+    if request.param == "sqlite":
+        storage = SQLiteStorage(str(tmp_path / "db.sqlite3"))
+    elif request.param == "json_journal":
+        storage = models.storage.JSONFileStorage(use_journal=True)
+    else:
+        storage = create_storage(request.param)
+    monkeypatch.setattr(models.base, "storage", storage)
+    User.load_from_file()
+    return storage
+
+
+def test_rolled_back_update(storage):
+    """ A stored user changed in place and saved in a rolled back batch
+    is read, searched and persisted as before the batch
+    """
+    user = User()
+    user.email = "user@hbtn.io"
+    user.first_name = "Before"
+    user.save()
+    updated_at = User.get(user.id).to_json()["updated_at"]
+    with pytest.raises(RuntimeError):
+        with User.batch():
+            user.first_name = "RolledBack"
+            user.email = "other@hbtn.io"
+            user.save()
+            raise RuntimeError("rolled back")
+
+    stored = User.get(user.id)
+    assert stored.first_name == "Before"
+    assert stored.to_json()["updated_at"] == updated_at
+    assert [u.id for u in User.search({"email": "user@hbtn.io"})] == [user.id]
+    assert User.search({"email": "other@hbtn.io"}) == []
+
+    # A later write persists the user as it was before the batch
+    other = User()
+    other.email = "other@hbtn.io"
+    other.save()
+    User.save_to_file()
+    User.load_from_file()
+    assert User.get(user.id).first_name == "Before"
+    assert User.count() == 2
+
+
+def test_rolled_back_creation_and_removal(storage):
+    """ Users created in a rolled back batch are dropped, removed ones
+    are back
+    """
+    kept = User()
+    kept.email = "kept@hbtn.io"
+    kept.save()
+    with pytest.raises(RuntimeError):
+        with User.batch():
+            created = User()
+            created.email = "created@hbtn.io"
+            created.save()
+            kept.remove()
+            raise RuntimeError("rolled back")
+    assert User.get(created.id) is None
+    assert User.get(kept.id).email == "kept@hbtn.io"
+    assert User.search({"email": "kept@hbtn.io"})[0].id == kept.id
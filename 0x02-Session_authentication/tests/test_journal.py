@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+""" Tests of the journal of JSONFileStorage
+"""
+import os
+import subprocess
+import sys
+import pytest
+import models.base
+import models.storage
+from models.storage import JSONFileStorage
+from models.user import User
+
+# Saves until the journal is rotated, then exits at once
+ROTATE_AND_EXIT = """
+import os
+from models.user import User
+User.load_from_file()
+i = 0
+while not os.path.exists(".db_User.journal.old"):
+    user = User()
+    user.email = "{}@hbtn.io".format(i)
+    user.save()
+    i += 1
+print(i)
+"""
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    """ Journaled storage in an empty directory, compacted past 2000
+    bytes
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delitem(models.storage.DATA, "User", raising=False)
+    monkeypatch.setattr(models.storage, "JOURNAL_COMPACT_SIZE", 2000)
+    monkeypatch.setattr(models.base, "storage",
+                        JSONFileStorage(use_journal=True))
+    User.load_from_file()
+    return tmp_path
+
+
+def stored_emails() -> set:
+    """ Emails of the users in the files, read by a new storage
+    """
+    models.base.storage = JSONFileStorage(use_journal=True)
+    User.load_from_file()
+    return {user.email for user in User.all()}
+
+
+def test_leftover_rotated_journal_is_folded_on_load(journal):
+    """ A rotated journal whose compaction never finished is folded
+    into the snapshot by the next load
+    """
+    for i in range(3):
+        User(email="{}@hbtn.io".format(i)).save()
+    os.replace(".db_User.journal", ".db_User.journal.old")
+    User(email="3@hbtn.io").save()
+
+    assert stored_emails() == {"{}@hbtn.io".format(i) for i in range(4)}
+    assert not os.path.exists(".db_User.journal.old")
+    assert not os.path.exists(".db_User.journal")
+
+
+def test_compaction_finishes_before_exit(journal):
+    """ A process exiting right after rotating its journal still
+    writes the snapshot and drops the rotated journal
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root, DB_JOURNAL="true",
+               DB_JOURNAL_COMPACT_SIZE="2000", MODELS_STORAGE="json")
+    count = int(subprocess.run([sys.executable, "-c", ROTATE_AND_EXIT],
+                               env=env, check=True, capture_output=True,
+                               text=True).stdout)
+
+    assert not os.path.exists(".db_User.journal.old")
+    assert stored_emails() == {"{}@hbtn.io".format(i)
+                               for i in range(count)}
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+""" Tests of the principals cached by SessionAuth
+"""
+import gc
+import weakref
+import pytest
+import models.base
+import models.storage
+from models.base import write_listeners
+from models.storage import MemoryStorage
+from models.user import User
+from api.v1.auth.session_auth import PrincipalCache, SessionAuth
+
+
+@pytest.fixture
+def user(monkeypatch):
+    """ A user saved in an empty memory storage
+    """
+    monkeypatch.delitem(models.storage.DATA, "User", raising=False)
+    monkeypatch.setattr(models.base, "storage", MemoryStorage())
+    User.load_from_file()
+    user = User()
+    user.email = "user@hbtn.io"
+    user.first_name = "Old"
+    user.save()
+    return user
+
+
+def test_write_during_build_is_not_cached(user, monkeypatch):
+    """ A principal built from a user read before a write to it is not
+    cached, so the next request sees the write
+    """
+    principals = PrincipalCache()
+    get = User.get
+
+    def racing_get(user_id):
+        """ Read the user, then let a write land before it is cached
+        """
+        stale = User(**get(user_id).to_json(True))
+        user.first_name = "New"
+        principals.invalidate(user_id)
+        return stale
+
+    monkeypatch.setattr(User, "get", racing_get)
+    assert principals.get(user.id).user.first_name == "Old"
+    assert len(principals) == 0
+    monkeypatch.setattr(User, "get", get)
+    assert principals.get(user.id).user.first_name == "New"
+    assert len(principals) == 1
+
+
+def test_versions_are_bounded(user):
+    """ Invalidated user IDs are forgotten past max_size, and principals
+    are still cached afterwards
+    """
+    principals = PrincipalCache(max_size=2)
+    for i in range(10):
+        principals.invalidate(str(i))
+    assert len(principals._versions) <= 2
+    assert principals.get(user.id) is not None
+    assert len(principals) == 1
+
+
+def test_listener_registered_once(user):
+    """ Writes reach the caches of live SessionAuth instances through a
+    single listener, which does not keep dropped instances alive
+    """
+    listeners = len(write_listeners)
+    auths = [SessionAuth() for _ in range(5)]
+    assert len(write_listeners) == listeners
+    for principals in (auth.principals for auth in auths):
+        principals.get(user.id)
+
+    user.first_name = "New"
+    user.save()
+    assert all(len(auth.principals) == 0 for auth in auths)
+
+    caches = weakref.WeakSet(auth.principals for auth in auths)
+    del auths, principals
+    gc.collect()
+    assert len(caches) == 0
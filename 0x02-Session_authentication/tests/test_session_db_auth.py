@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+""" Tests of SessionDBAuth shared by several worker processes
+"""
+import multiprocessing
+import pytest
+import models.base
+import models.storage
+from models.storage import SharedJSONFileStorage, SQLiteStorage
+from models.user_session import UserSession
+from api.v1.auth.session_db_auth import SessionDBAuth
+
+
+def shared_storage(kind: str):
+    """ A new storage of a kind shared by processes, in the current
+    directory
+    """
+    if kind == "sqlite":
+        return SQLiteStorage("db.sqlite3")
+    return SharedJSONFileStorage()
+
+
+@pytest.fixture(params=["json_shared", "sqlite"])
+def kind(request, tmp_path, monkeypatch):
+    """ Shared storage of each kind in an empty directory
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delitem(models.storage.DATA, "UserSession", raising=False)
+    monkeypatch.setattr(models.base, "storage", shared_storage(
+        request.param))
+    return request.param
+
+
+def log_out_everywhere(kind: str, user_id: str):
+    """ Destroy the sessions of a user from another worker
+    """
+    models.base.storage = shared_storage(kind)
+    SessionDBAuth().destroy_user_sessions(user_id)
+
+
+def test_session_destroyed_by_another_worker(kind):
+    """ A cached session is refused as soon as another worker destroys
+    it, not after the cache TTL
+    """
+    auth = SessionDBAuth()
+    session_id = auth.create_session("user")
+    other_id = SessionDBAuth().create_session("other")
+    assert auth.user_id_for_session_id(session_id) == "user"
+    assert auth.user_id_for_session_id(other_id) == "other"
+    assert session_id in auth.session_store
+
+    worker = multiprocessing.get_context("fork").Process(
+        target=log_out_everywhere, args=(kind, "user"))
+    worker.start()
+    worker.join(60)
+    assert worker.exitcode == 0
+
+    assert auth.user_id_for_session_id(session_id) is None
+    assert auth.user_id_for_session_id(other_id) == "other"
+
+
+def test_cache_hits_skip_the_storage(kind, monkeypatch):
+    """ While the sessions are unchanged, lookups are served from the
+    cache
+    """
+    auth = SessionDBAuth()
+    session_id = auth.create_session("user")
+    assert auth.user_id_for_session_id(session_id) == "user"
+
+    def no_search(attributes):
+        raise AssertionError("storage searched")
+
+    monkeypatch.setattr(UserSession, "search", no_search)
+    assert auth.user_id_for_session_id(session_id) == "user"
+
+
+def log_in(kind: str, user_id: str):
+    """ Create a session from another worker
+    """
+    models.base.storage = shared_storage(kind)
+    SessionDBAuth().create_session(user_id)
+
+
+def test_login_of_another_worker_keeps_the_cache(kind, monkeypatch):
+    """ Sessions created by another worker leave the cached ones in
+    place: only removals drop the cache
+    """
+    auth = SessionDBAuth()
+    session_id = auth.create_session("user")
+    assert auth.user_id_for_session_id(session_id) == "user"
+
+    worker = multiprocessing.get_context("fork").Process(
+        target=log_in, args=(kind, "other"))
+    worker.start()
+    worker.join(60)
+    assert worker.exitcode == 0
+
+    def no_search(attributes):
+        raise AssertionError("storage searched")
+
+    monkeypatch.setattr(UserSession, "search", no_search)
+    assert auth.user_id_for_session_id(session_id) == "user"
+    assert auth.create_session("user") in auth.session_store
+    assert auth.user_id_for_session_id(session_id) == "user"
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+""" Tests of the in-memory session store of SessionAuth
+"""
+import time
+import pytest
+from api.v1.auth.session_auth import SessionStore
+
+
+def test_reads_like_a_dict():
+    """ Sessions are read by subscript, get and in, as from the dict
+    of user IDs by session ID the store replaces
+    """
+    store = SessionStore()
+    session_id = store.create("user")
+    assert store[session_id] == "user"
+    assert store.get(session_id) == "user"
+    assert session_id in store
+    with pytest.raises(KeyError):
+        store["missing"]
+    assert store.get("missing", "default") == "default"
+
+
+def test_expired_session_is_missing(monkeypatch):
+    """ An expired session raises KeyError and is dropped
+    """
+    store = SessionStore(duration=10)
+    session_id = store.create("user")
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    with pytest.raises(KeyError):
+        store[session_id]
+    assert len(store) == 0
+
+
+def test_least_recently_used_is_evicted():
+    """ Past max_size sessions, the least recently used one goes first
+    """
+    store = SessionStore(max_size=2)
+    first = store.create("a")
+    second = store.create("b")
+    store[first]
+    third = store.create("c")
+    assert first in store and third in store
+    assert second not in store
+    assert store.delete_user("a") == 1
+    assert first not in store
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+""" Tests of SharedJSONFileStorage with several writing processes
+"""
+import multiprocessing
+import os
+import pytest
+import models.base
+import models.storage
+from models.storage import SharedJSONFileStorage
+from models.user import User
+
+WORKERS = 4
+USERS_PER_WORKER = 60
+
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    """ Shared storage in an empty directory, with a small journal so
+    that it is rotated and compacted during the tests
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(models.storage, "JOURNAL_COMPACT_SIZE", 4096)
+    monkeypatch.setattr(models.base, "storage", SharedJSONFileStorage())
+    User.load_from_file()
+
+
+def new_user(name: str, i: int) -> User:
+    """ A user with an email unique to a worker and an index
+    """
+    user = User()
+    user.email = "{}-{}@hbtn.io".format(name, i)
+    return user
+
+
+def write_users(mode: str, name: str):
+    """ Save USERS_PER_WORKER users in a child process, one by one,
+    in batches, with full flushes or with rolled back batches
+    """
+    User.load_from_file()
+    for i in range(USERS_PER_WORKER):
+        if mode == "batch" and i % 5 == 0:
+            User.bulk_save(new_user(name, j) for j in range(i, i + 5))
+        elif mode == "save_to_file":
+            new_user(name, i).save()
+            if i % 10 == 9:
+                User.save_to_file()
+        elif mode == "rollback" and i % 10 == 0:
+            try:
+                with User.batch():
+                    new_user(name, -1 - i).save()
+                    # Reads in the batch apply the records of the others
+                    User.count()
+                    raise RuntimeError("rolled back")
+            except RuntimeError:
+                pass
+            new_user(name, i).save()
+        elif mode != "batch":
+            new_user(name, i).save()
+
+
+def write_users_when_set(event, name: str):
+    """ Save users one by one once `event` is set
+    """
+    event.wait()
+    write_users("save", name)
+
+
+def stored_emails() -> set:
+    """ Emails of the users in the files, read by a fresh storage
+    """
+    models.base.storage = SharedJSONFileStorage()
+    User.load_from_file()
+    return {user.email for user in User.all()}
+
+
+@pytest.mark.parametrize("modes", [
+    ("save",) * WORKERS,
+    ("save", "batch", "save", "batch"),
+    ("save", "save_to_file", "batch", "save_to_file"),
+    ("save", "rollback", "batch", "rollback"),
+])
+def test_concurrent_writes_are_all_kept(shared, modes):
+    """ Every user saved by any process is in the files at the end
+    """
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=write_users,
+                               args=(mode, "w{}".format(n)))
+               for n, mode in enumerate(modes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    expected = {"w{}-{}@hbtn.io".format(n, i)
+                for n in range(len(modes))
+                for i in range(USERS_PER_WORKER)}
+    assert stored_emails() == expected
+
+
+def test_rollback_keeps_records_of_others(shared):
+    """ Records of another process read during a rolled back batch
+    are still seen, and kept by the next flush
+    """
+    context = multiprocessing.get_context("fork")
+    event = context.Event()
+    # Forked out of the batch, which a child would inherit
+    other = context.Process(target=write_users_when_set,
+                            args=(event, "other"))
+    other.start()
+    with pytest.raises(RuntimeError):
+        with User.batch():
+            new_user("local", 0).save()
+            event.set()
+            other.join(60)
+            assert other.exitcode == 0
+            assert User.count() == USERS_PER_WORKER + 1
+            raise RuntimeError("rolled back")
+
+    assert User.count() == USERS_PER_WORKER
+    User.save_to_file()
+    assert stored_emails() == {"other-{}@hbtn.io".format(i)
+                               for i in range(USERS_PER_WORKER)}
+
+
+def test_stale_compaction_keeps_newer_journal(shared):
+    """ A compaction finishing after a flush and a new rotation does
+    not replace the files with its older snapshot
+    """
+    storage = models.base.storage
+    new_user("old", 0).save()
+    # Snapshot and generation of a rotation whose compaction is late
+    objs = dict(models.storage.DATA["User"])
+    generation = storage._generation("User")
+    User.save_to_file()
+    new_user("new", 0).save()
+    # Another process rotates the journal, its compaction still pending
+    os.replace(".db_User.journal", ".db_User.journal.old")
+    storage._next_generation("User")
+
+    storage._compact(User, objs, ".db_User.journal.old", generation)
+
+    assert stored_emails() == {"old-0@hbtn.io", "new-0@hbtn.io"}
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+""" Tests of the users views
+"""
+import json
+import pytest
+from flask import Flask
+import models.base
+import models.storage
+from models.storage import MemoryStorage
+from models.user import User
+from api.v1.auth.session_auth import SessionAuth
+from api.v1.views import app_views
+from api.v1.views import users as users_view
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """ An app serving the views with session auth, over 20 users in an
+    empty memory storage and pages of at most 5 users
+    """
+    monkeypatch.delitem(models.storage.DATA, "User", raising=False)
+    monkeypatch.setattr(models.base, "storage", MemoryStorage())
+    monkeypatch.setattr(users_view, "MAX_LIMIT", 5)
+    User.load_from_file()
+    for i in range(20):
+        user = User()
+        user.email = "user{}@hbtn.io".format(i)
+        user.save()
+    app = Flask(__name__)
+    app.register_blueprint(app_views)
+    app.extensions["auth"] = SessionAuth()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """ A client of the app
+    """
+    return app.test_client()
+
+
+def ids(response):
+    """ IDs of the users of a response
+    """
+    return [user["id"] for user in json.loads(response.get_data())]
+
+
+def test_pages_are_capped(client):
+    """ A page holds at most MAX_LIMIT users, with or without a limit
+    """
+    everyone = sorted(user.id for user in User.all())
+    for query in ("?limit=50", "?cursor=0", "?cursor=0&limit=50"):
+        response = client.get("/api/v1/users" + query)
+        assert ids(response) == everyone[:5]
+        assert response.headers["X-Next-Cursor"] == everyone[4]
+
+
+def test_cursor_walks_every_page(client):
+    """ Following X-Next-Cursor from a cursor alone yields every user
+    """
+    seen, cursor = [], "0"
+    while cursor is not None:
+        response = client.get("/api/v1/users?cursor=" + cursor)
+        seen += ids(response)
+        cursor = response.headers.get("X-Next-Cursor")
+    assert seen == sorted(user.id for user in User.all())
+
+
+def test_every_user_read_page_by_page(client, monkeypatch):
+    """ Without parameters every user is streamed, never reading more
+    than MAX_LIMIT users at a time
+    """
+    limits = []
+    page = User.page
+
+    def counting_page(after=None, limit=None):
+        """ Record the limit of each page read
+        """
+        limits.append(limit)
+        return page(after, limit)
+
+    monkeypatch.setattr(User, "page", counting_page)
+    response = client.get("/api/v1/users")
+    assert ids(response) == sorted(user.id for user in User.all())
+    assert "X-Next-Cursor" not in response.headers
+    assert limits and all(limit == 5 for limit in limits)
+
+
+def test_invalid_limit(client):
+    """ A limit that is not a positive integer is refused
+    """
+    for query in ("?limit=0", "?limit=-1", "?limit=a"):
+        assert client.get("/api/v1/users" + query).status_code == 400
+
+
+def test_delete_user_destroys_sessions(app, client):
+    """ Deleting a user ends the sessions of the auth of the app
+    """
+    auth = app.extensions["auth"]
+    user, other = User.all()[:2]
+    session_id = auth.create_session(user.id)
+    other_session_id = auth.create_session(other.id)
+    response = client.delete("/api/v1/users/" + user.id)
+    assert response.status_code == 200
+    assert User.get(user.id) is None
+    assert auth.user_id_for_session_id(session_id) is None
+    assert auth.user_id_for_session_id(other_session_id) == other.id
+    assert client.delete("/api/v1/users/" + user.id).status_code == 404